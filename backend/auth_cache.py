@@ -0,0 +1,58 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from metrics import cache_event
+
+# ======================================================
+#  AUTHENTICATED PRINCIPAL CACHE
+# ======================================================
+# get_current_user resolves the same few users over and over; this keeps
+# their profile rows in memory for a short TTL, keyed by username. Profile
+# writes invalidate the entry in this process; other worker processes may
+# serve the old profile for at most PRINCIPAL_CACHE_TTL_SECONDS.
+
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+
+# Never keep credentials in the cache; nothing downstream of get_current_user needs them.
+_PRIVATE_FIELDS = ('hashed_password', 'password_reset_token', 'password_reset_expires')
+
+
+class PrincipalCache:
+    def __init__(self, ttl: float = PRINCIPAL_CACHE_TTL_SECONDS, max_size: int = PRINCIPAL_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: OrderedDict[str, tuple[dict, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, username: str) -> dict | None:
+        if self.ttl <= 0: return None
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None:
+                cache_event("principal", "miss")
+                return None
+            principal, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[username]
+                cache_event("principal", "expired")
+                return None
+            self._entries.move_to_end(username)
+        cache_event("principal", "hit")
+        return principal
+
+    def put(self, username: str, user) -> dict:
+        principal = {k: v for k, v in dict(user).items() if k not in _PRIVATE_FIELDS}
+        if self.ttl <= 0: return principal
+        with self._lock:
+            self._entries[username] = (principal, time.monotonic() + self.ttl)
+            self._entries.move_to_end(username)
+            while len(self._entries) > self.max_size: self._entries.popitem(last=False)
+        return principal
+
+    def invalidate(self, username: str):
+        with self._lock: self._entries.pop(username, None)
+
+    def clear(self):
+        with self._lock: self._entries.clear()
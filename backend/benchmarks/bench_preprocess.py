@@ -0,0 +1,98 @@
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+import numpy as np
+from io import BytesIO
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from preprocessing import ImagePreprocessor
+
+# ======================================================
+#  IMAGE PREPROCESSING MICRO-BENCHMARK
+# ======================================================
+# Compares the original full-resolution decode with preprocessing.py on a
+# synthetic phone-sized JPEG. Each variant runs in its own subprocess so the
+# peak RSS it reports belongs to that variant alone.
+#   python benchmarks/bench_preprocess.py [--width 4032 --height 3024 --iterations 20]
+
+
+def make_jpeg(width: int, height: int, quality: int = 90) -> bytes:
+    # Smooth gradients plus noise compress roughly like a real photo.
+    y, x = np.mgrid[0:height, 0:width]
+    rng = np.random.default_rng(0)
+    pixels = np.stack([(x * 255 // width), (y * 255 // height), ((x + y) * 127 // (width + height))], axis=-1)
+    pixels = np.clip(pixels + rng.normal(0, 12, pixels.shape), 0, 255).astype(np.uint8)
+    buf = BytesIO()
+    Image.fromarray(pixels).save(buf, 'JPEG', quality=quality)
+    return buf.getvalue()
+
+
+def baseline_preprocess(data: bytes) -> np.ndarray:
+    img = Image.open(BytesIO(data)).convert('RGB').resize((224, 224))
+    return (np.array(img, dtype=np.float32) / 127.5) - 1
+
+
+def peak_rss_kib() -> int:
+    # VmHWM is reset on exec; ru_maxrss (the non-Linux fallback) can carry over the parent's peak.
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"): return int(line.split()[1])
+    except OSError: pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_variant(variant: str, data: bytes, iterations: int) -> dict:
+    rss_before = peak_rss_kib()
+    if variant == "baseline":
+        fn = baseline_preprocess
+    else:
+        preprocessor = ImagePreprocessor()
+        def fn(d):
+            buffer = preprocessor.preprocess(d)
+            preprocessor.release(buffer)
+    fn(data)  # warm-up
+    cpu, wall = [], []
+    for _ in range(iterations):
+        c0, w0 = time.process_time(), time.perf_counter()
+        fn(data)
+        cpu.append(time.process_time() - c0)
+        wall.append(time.perf_counter() - w0)
+    peak = peak_rss_kib()
+    return {"variant": variant, "iterations": iterations,
+            "cpu_ms_per_image": round(1000 * float(np.median(cpu)), 2), "wall_ms_per_image": round(1000 * float(np.median(wall)), 2),
+            "peak_rss_mib": round(peak / 1024, 1), "peak_rss_delta_mib": round((peak - rss_before) / 1024, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare baseline and optimized upload preprocessing.")
+    parser.add_argument("--width", type=int, default=4032)
+    parser.add_argument("--height", type=int, default=3024)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--variant", choices=["baseline", "optimized"], help=argparse.SUPPRESS)
+    parser.add_argument("--image", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant:
+        with open(args.image, 'rb') as f: data = f.read()
+        print(json.dumps(run_variant(args.variant, data, args.iterations)))
+        return
+
+    path = os.path.join(os.getenv("TMPDIR", "/tmp"), f"nutriscan_bench_{args.width}x{args.height}.jpg")
+    with open(path, 'wb') as f: f.write(make_jpeg(args.width, args.height))
+    results = {"image": {"width": args.width, "height": args.height, "bytes": os.path.getsize(path)}, "variants": []}
+    for variant in ("baseline", "optimized"):
+        out = subprocess.run([sys.executable, __file__, "--variant", variant, "--image", path, "--iterations", str(args.iterations)],
+                             check=True, capture_output=True, text=True).stdout
+        results["variants"].append(json.loads(out))
+    os.remove(path)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
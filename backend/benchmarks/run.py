@@ -0,0 +1,234 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import tempfile
+import numpy as np
+from datetime import date, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import seed
+from bench_preprocess import make_jpeg, baseline_preprocess
+
+# ======================================================
+#  NUTRISCAN LOAD TEST & MICRO-BENCHMARK SUITE
+# ======================================================
+# Seeds a synthetic database, starts the real app in-process (lifespan
+# included) and drives it through httpx's ASGI transport at several
+# concurrency levels, then times the building blocks on their own.
+# Results are written as JSON; pass --baseline to diff against an older run.
+#   python benchmarks/run.py --output results.json [--baseline old.json]
+#   python benchmarks/run.py --quick            # small smoke-sized run
+
+# Requests per concurrency level for each endpoint, as a fraction of --requests.
+ENDPOINT_WEIGHTS = {
+    "log_add": 1.0, "log_bulk": 0.25, "log_for_date": 1.0, "summary_weekly": 1.0, "summary_monthly": 1.0,
+    "summary_range_year": 0.5, "food_search": 1.0, "food_suggest": 1.0, "identify": 0.25, "login": 0.05,
+}
+
+
+def latency_stats(latencies: list[float], elapsed: float, errors: int) -> dict:
+    ms = np.asarray(latencies) * 1000
+    return {
+        "requests": len(latencies), "errors": errors, "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(float(ms.mean()), 3), "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3), "p99_ms": round(float(np.percentile(ms, 99)), 3),
+    }
+
+
+class Workload:
+    def __init__(self, main, tokens: list[str], food_names: list[str], image: bytes, rng: random.Random, days: int):
+        self.main = main
+        self.tokens = tokens
+        self.food_names = food_names
+        self.image = image
+        self.rng = rng
+        self.today = date.today()
+        self.days = days
+
+    def headers(self): return {"Authorization": f"Bearer {self.rng.choice(self.tokens)}"}
+    def food(self): return self.rng.choice(self.food_names)
+    def day(self): return (self.today - timedelta(days=self.rng.randrange(self.days))).isoformat()
+
+    def request(self, name: str) -> tuple[str, str, dict]:
+        if name == "log_add": return "POST", "/api/log", {"params": {"food_name": self.food()}, "headers": self.headers()}
+        if name == "log_bulk":
+            items = [{"food_name": self.food(), "log_date": self.day(), "quantity": 1} for _ in range(20)]
+            return "POST", "/api/log/bulk", {"json": {"items": items}, "headers": self.headers()}
+        if name == "log_for_date": return "GET", f"/api/log/{self.day()}", {"headers": self.headers()}
+        if name == "summary_weekly": return "POST", "/api/summary/weekly", {"json": {"date_str": self.day()}, "headers": self.headers()}
+        if name == "summary_monthly":
+            d = self.today - timedelta(days=self.rng.randrange(self.days))
+            return "POST", "/api/summary/monthly", {"json": {"year": d.year, "month": d.month}, "headers": self.headers()}
+        if name == "summary_range_year":
+            body = {"start_date": (self.today - timedelta(days=364)).isoformat(), "end_date": self.today.isoformat()}
+            return "POST", "/api/summary/range", {"json": body, "headers": self.headers()}
+        if name == "food_search": return "GET", "/api/food/search", {"params": {"q": self.food()}}
+        if name == "food_suggest": return "GET", "/api/food/suggest", {"params": {"q": self.food()[:self.rng.randint(2, 6)], "k": 10}}
+        if name == "identify": return "POST", "/api/food/identify", {"files": {"file": ("meal.jpg", self.image, "image/jpeg")}}
+        if name == "login": return "POST", "/api/users/login", {"data": {"username": f"bench{self.rng.randrange(len(self.tokens))}", "password": seed.BENCH_PASSWORD}}
+        raise ValueError(name)
+
+
+async def drive(client, workload: Workload, name: str, total: int, concurrency: int) -> dict:
+    latencies, errors = [], 0
+    remaining = total
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            method, url, kwargs = workload.request(name)
+            started = time.perf_counter()
+            r = await client.request(method, url, **kwargs)
+            latencies.append(time.perf_counter() - started)
+            if r.status_code >= 400: errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latency_stats(latencies, time.perf_counter() - started, errors)
+
+
+def time_calls(fn, iterations: int) -> dict:
+    fn()  # warm-up
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    us = np.asarray(samples) * 1e6
+    return {"iterations": iterations, "p50_us": round(float(np.percentile(us, 50)), 2), "p95_us": round(float(np.percentile(us, 95)), 2),
+            "ops_per_sec": round(1e6 / float(us.mean()), 1)}
+
+
+def micro_benchmarks(main, food_names: list[str], rng: random.Random, iterations: int) -> dict:
+    results = {}
+    queries = [rng.choice(food_names) for _ in range(64)]
+    prefixes = [q[:3] for q in queries]
+    q = iter(queries * (iterations // len(queries) + 2))
+    p = iter(prefixes * (iterations // len(prefixes) + 2))
+    results["food_index_best"] = time_calls(lambda: main.food_index.best(next(q)), iterations)
+    results["food_index_prefix_top10"] = time_calls(lambda: main.food_index.search(next(p), 10), iterations)
+    with main.database.reader() as db:
+        like = iter(queries * (iterations // len(queries) + 2))
+        results["sqlite_like_scan"] = time_calls(lambda: db.execute("SELECT * FROM foods WHERE name LIKE ? LIMIT 1", (f"%{next(like)}%",)).fetchone(), max(10, iterations // 10))
+
+    photo = make_jpeg(4032, 3024)
+    def optimized():
+        main.image_preprocessor.release(main.image_preprocessor.preprocess(photo))
+    results["preprocess_12mp_baseline"] = time_calls(lambda: baseline_preprocess(photo), 10)
+    results["preprocess_12mp_optimized"] = time_calls(optimized, 10)
+
+    if main.model_loader.ready:
+        for batch_size in (1, 8, 16):
+            batch = np.zeros((batch_size, *main.MODEL_INPUT_SIZE, 3), dtype=np.float32)
+            stats = time_calls(lambda: main.model_loader.predict_batch(batch), 20)
+            stats["images_per_sec"] = round(stats["ops_per_sec"] * batch_size, 1)
+            results[f"inference_batch_{batch_size}"] = stats
+    else:
+        results["inference"] = {"skipped": f"model {main.model_loader.state}: {main.model_loader.error}"}
+    return results
+
+
+async def run_suite(args) -> dict:
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix="nutriscan_bench_"), "bench.db")
+    seeded = seed.seed(db_path, args.users, args.log_rows, args.foods, args.days, args.seed, force=args.force)
+    os.environ.update({"DB_PATH": db_path, "FOOD_INDEX_REFRESH_SECONDS": "0", "PEXELS_API_KEY": ""})
+    os.chdir(BACKEND_DIR)
+    import main  # imported only now so it picks up the environment above
+    import httpx
+
+    rng = random.Random(args.seed)
+    results = {"meta": {"started": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(), "machine": platform.machine(),
+                        "cpus": os.cpu_count(), "dataset": seeded, "concurrency": args.concurrency, "requests": args.requests},
+               "endpoints": {}, "micro": {}}
+
+    async with main.lifespan(main.app):
+        with main.database.reader() as db:
+            users = [dict(row) for row in db.execute("SELECT * FROM users ORDER BY id")]
+            food_names = [row[0] for row in db.execute("SELECT name FROM foods")]
+        tokens = [main.create_user_token(user) for user in users]
+        workload = Workload(main, tokens, food_names, make_jpeg(1280, 960), rng, args.days)
+
+        deadline = time.monotonic() + args.model_timeout
+        while main.model_loader.state in ("not_loaded", "loading") and time.monotonic() < deadline: await asyncio.sleep(0.2)
+        results["meta"]["model"] = main.model_loader.status()
+
+        endpoints = [e for e in ENDPOINT_WEIGHTS if not args.endpoints or e in args.endpoints]
+        if not main.model_loader.ready and "identify" in endpoints:
+            endpoints.remove("identify")
+            results["endpoints"]["identify"] = {"skipped": f"model {main.model_loader.state}"}
+
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for name in endpoints:
+                total = max(args.concurrency[-1], int(args.requests * ENDPOINT_WEIGHTS[name]))
+                results["endpoints"][name] = {}
+                for concurrency in args.concurrency:
+                    stats = await drive(client, workload, name, total, concurrency)
+                    results["endpoints"][name][str(concurrency)] = stats
+                    print(f"{name:<20} c={concurrency:<4} {stats['throughput_rps']:>9.1f} req/s  p50 {stats['p50_ms']:>8.2f} ms  p95 {stats['p95_ms']:>8.2f} ms  p99 {stats['p99_ms']:>8.2f} ms  errors {stats['errors']}")
+
+        if not args.skip_micro:
+            results["micro"] = await asyncio.to_thread(micro_benchmarks, main, food_names, rng, args.micro_iterations)
+            for name, stats in results["micro"].items(): print(f"{name:<28} {stats}")
+    return results
+
+
+def compare(current: dict, baseline: dict):
+    print("\n--- Comparison against baseline (p50 / p99 / throughput, current vs baseline) ---")
+    for name, levels in current["endpoints"].items():
+        for concurrency, stats in levels.items():
+            old = baseline.get("endpoints", {}).get(name, {}).get(concurrency)
+            if not isinstance(stats, dict) or "p50_ms" not in stats or not old or "p50_ms" not in old: continue
+            ratio = stats["throughput_rps"] / old["throughput_rps"] if old["throughput_rps"] else float("nan")
+            print(f"{name:<20} c={concurrency:<4} p50 {stats['p50_ms']:>8.2f} vs {old['p50_ms']:>8.2f} ms   p99 {stats['p99_ms']:>8.2f} vs {old['p99_ms']:>8.2f} ms   throughput x{ratio:.2f}")
+    for name, stats in current.get("micro", {}).items():
+        old = baseline.get("micro", {}).get(name)
+        if old and "p50_us" in stats and "p50_us" in old:
+            print(f"{name:<28} p50 {stats['p50_us']:>10.2f} vs {old['p50_us']:>10.2f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test and micro-benchmark the NutriScan API in-process.")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="earlier results JSON to compare against")
+    parser.add_argument("--db", help="where to write the synthetic database (default: a temp dir)")
+    parser.add_argument("--force", action="store_true", help="overwrite the --db file if it exists")
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--log-rows", type=int, default=200_000)
+    parser.add_argument("--foods", type=int, default=5_000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--requests", type=int, default=2_000, help="requests per endpoint per concurrency level (scaled by endpoint weight)")
+    parser.add_argument("--concurrency", type=lambda s: sorted(int(x) for x in s.split(",")), default=[1, 8, 32])
+    parser.add_argument("--endpoints", type=lambda s: s.split(","), help="comma-separated subset of: " + ",".join(ENDPOINT_WEIGHTS))
+    parser.add_argument("--model-timeout", type=float, default=120, help="seconds to wait for the model before skipping identify")
+    parser.add_argument("--micro-iterations", type=int, default=5_000)
+    parser.add_argument("--skip-micro", action="store_true")
+    parser.add_argument("--quick", action="store_true", help="tiny dataset and request counts, for checking the harness itself")
+    args = parser.parse_args()
+    if args.quick:
+        args.users, args.log_rows, args.foods, args.requests, args.concurrency, args.micro_iterations = 50, 5_000, 500, 100, [1, 8], 500
+
+    output = os.path.abspath(args.output)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f: baseline = json.load(f)
+    try: results = asyncio.run(run_suite(args))
+    except FileExistsError as e:
+        print(e)
+        sys.exit(1)
+    with open(output, "w") as f: json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}")
+    if baseline: compare(results, baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import os
+import sys
+import csv
+import random
+import sqlite3
+import argparse
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from migrations import migrate
+import rollup
+
+# ======================================================
+#  SYNTHETIC BENCHMARK DATABASE
+# ======================================================
+# Builds a fresh database with the real schema (via migrations) filled with
+# deterministic synthetic data: foods derived from nutrition_data.csv
+# (padded with numbered variants to reach --foods), users with complete
+# profiles, and --log-rows daily_log entries spread over --days days.
+#   python benchmarks/seed.py bench.db --users 1000 --log-rows 200000 --foods 5000
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CSV_PATH = os.path.join(BACKEND_DIR, 'nutrition_data.csv')
+BENCH_PASSWORD = "bench-password"
+
+CSV_COLUMNS = {
+    'Food_Item': 'name', 'Calories (kcal)': 'calories', 'Protein (g)': 'protein',
+    'Carbohydrates (g)': 'carbs', 'Fat (g)': 'fat', 'Sodium (mg)': 'sodium',
+    'Cholesterol (mg)': 'cholesterol'
+}
+NUMERIC = ('calories', 'protein', 'carbs', 'fat', 'sodium', 'cholesterol')
+VARIANTS = ("Grilled", "Baked", "Fresh", "Organic", "Homemade", "Steamed", "Roasted", "Frozen", "Spicy", "Low Fat")
+
+
+def load_base_foods(csv_path: str = CSV_PATH) -> list[dict]:
+    foods = {}
+    with open(csv_path, newline='') as f:
+        for row in csv.DictReader(f):
+            name = (row.get('Food_Item') or '').strip()
+            if not name: continue
+            food = {'name': name}
+            for column, key in CSV_COLUMNS.items():
+                if key == 'name': continue
+                try: food[key] = float(row[column])
+                except (TypeError, ValueError): food[key] = 0.0
+            foods.setdefault(name, food)
+    return list(foods.values())
+
+
+def synthetic_foods(count: int, rng: random.Random) -> list[dict]:
+    base = load_base_foods()
+    foods = list(base)
+    n = 0
+    while len(foods) < count:
+        source = base[n % len(base)]
+        variant = f"{VARIANTS[(n // len(base)) % len(VARIANTS)]} {source['name']} {n // (len(base) * len(VARIANTS)) + 1}"
+        scale = rng.uniform(0.7, 1.3)
+        foods.append(dict(source, name=variant, **{k: round(source[k] * scale, 2) for k in NUMERIC}))
+        n += 1
+    return foods[:count]
+
+
+def seed(path: str, users: int = 200, log_rows: int = 50_000, foods: int = 1_000, days: int = 365, seed_value: int = 42,
+         end_date: date | None = None, force: bool = False) -> dict:
+    # Never silently replace a database that may be the real one (e.g. --db my_nutrition.db).
+    if os.path.exists(path) and not force: raise FileExistsError(f"'{path}' already exists; pass --force to overwrite it.")
+    # Stale -wal/-shm files would otherwise be replayed into (or confuse) the fresh database.
+    for stale in (path, f"{path}-wal", f"{path}-shm"):
+        if os.path.exists(stale): os.remove(stale)
+    rng = random.Random(seed_value)
+    end_date = end_date or date.today()
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("PRAGMA journal_mode = WAL")
+        migrate(conn, verbose=False)
+        food_rows = synthetic_foods(foods, rng)
+        with conn:
+            conn.executemany("INSERT INTO foods (name, calories, protein, carbs, fat, sodium, cholesterol) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                             [(f['name'], *(f[k] for k in NUMERIC)) for f in food_rows])
+
+            # One bcrypt hash shared by every user: hashing 100k passwords would dominate seeding.
+            from passlib.context import CryptContext
+            hashed = CryptContext(schemes=["bcrypt"], deprecated="auto").hash(BENCH_PASSWORD)
+            activity = ('sedentary', 'light', 'moderate', 'active', 'very_active')
+            conn.executemany("INSERT INTO users (username, email, hashed_password, age, weight, height, sex, activity_level) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                             [(f"bench{i}", f"bench{i}@example.com", hashed, rng.randint(18, 75), round(rng.uniform(45, 120), 1),
+                               round(rng.uniform(150, 200), 1), rng.choice(('male', 'female')), rng.choice(activity)) for i in range(users)])
+
+            def log_batches(batch_size: int = 10_000):
+                batch = []
+                for _ in range(log_rows):
+                    food = food_rows[rng.randrange(len(food_rows))]
+                    q = rng.choice((0.5, 1, 1, 1, 1.5, 2))
+                    batch.append((rng.randint(1, users), (end_date - timedelta(days=rng.randrange(days))).isoformat(), food['name'],
+                                  food['calories'] * q, food['protein'] * q, food['carbs'] * q, food['fat'] * q))
+                    if len(batch) >= batch_size:
+                        yield batch
+                        batch = []
+                if batch: yield batch
+
+            for batch in log_batches():
+                conn.executemany("INSERT INTO daily_log (user_id, log_date, food_name, calories, protein, carbs, fat) VALUES (?, ?, ?, ?, ?, ?, ?)", batch)
+            rollup.backfill(conn)
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+    return {"path": path, "users": users, "log_rows": log_rows, "foods": len(food_rows), "days": days, "seed": seed_value}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create a synthetic NutriScan database for benchmarking.")
+    parser.add_argument("path")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--log-rows", type=int, default=50_000)
+    parser.add_argument("--foods", type=int, default=1_000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--force", action="store_true", help="overwrite the database at path if it exists")
+    args = parser.parse_args()
+    try: print(seed(args.path, args.users, args.log_rows, args.foods, args.days, args.seed, force=args.force))
+    except FileExistsError as e:
+        print(e)
+        sys.exit(1)
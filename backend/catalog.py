@@ -0,0 +1,145 @@
+import sys
+import sqlite3
+import argparse
+import pandas as pd
+from db import configure_connection
+from migrations import migrate
+
+# ======================================================
+#  FOOD CATALOG INGESTION (incremental upsert into foods)
+# ======================================================
+# Streams the nutrition CSV in chunks and merges it into `foods` in place:
+# rows keep their id, only rows whose values changed are rewritten, and names
+# no longer in the CSV are removed. Duplicate names are averaged, as the old
+# full rebuild did, by accumulating per-name sums and counts in a temporary
+# on-disk staging table, so memory is bounded by the chunk size rather than
+# the size of the file. Writes go to `foods` only, in short batched
+# transactions, so the API can keep serving from the same database.
+#   python catalog.py nutrition_data.csv [--dry-run] [--keep-missing]
+
+DB_NAME = 'my_nutrition.db'
+CSV_FILENAME = 'nutrition_data.csv'
+
+CSV_COLUMNS = {
+    'Food_Item': 'name', 'Calories (kcal)': 'calories', 'Protein (g)': 'protein',
+    'Carbohydrates (g)': 'carbs', 'Fat (g)': 'fat', 'Sodium (mg)': 'sodium',
+    'Cholesterol (mg)': 'cholesterol'
+}
+NUTRIENTS = ('calories', 'protein', 'carbs', 'fat', 'sodium', 'cholesterol')
+
+INGEST_CHUNK_ROWS = 50_000  # CSV rows parsed at a time
+INGEST_BATCH_ROWS = 5_000   # foods rows written per transaction
+
+_COLS = ", ".join(NUTRIENTS)
+_MEANS = ", ".join(f"s.{c} / s.n" for c in NUTRIENTS)
+
+_STAGE_SQL = f"""
+    INSERT INTO catalog_staging (name, {_COLS}, n) VALUES ({", ".join("?" * (len(NUTRIENTS) + 2))})
+    ON CONFLICT (name) DO UPDATE SET {", ".join(f"{c} = {c} + excluded.{c}" for c in NUTRIENTS)}, n = n + excluded.n
+"""
+
+_CHANGED = " OR ".join(f"f.{c} IS NOT s.{c} / s.n" for c in NUTRIENTS)
+
+_DIFF_SQL = f"""
+    SELECT IFNULL(SUM(f.id IS NULL), 0), IFNULL(SUM(f.id IS NOT NULL AND ({_CHANGED})), 0)
+    FROM catalog_staging s LEFT JOIN foods f ON f.name = s.name
+    WHERE s.rowid BETWEEN ? AND ?
+"""
+
+# Updates and inserts are separate statements (not an upsert) so unchanged rows are never rewritten
+# and existing names don't burn AUTOINCREMENT ids.
+_UPDATE_SQL = f"""
+    UPDATE foods SET ({_COLS}) = (SELECT {_MEANS} FROM catalog_staging s WHERE s.name = foods.name)
+    WHERE id IN (SELECT f.id FROM catalog_staging s JOIN foods f ON f.name = s.name WHERE s.rowid BETWEEN ? AND ? AND ({_CHANGED}))
+"""
+
+_INSERT_SQL = f"""
+    INSERT INTO foods (name, {_COLS})
+    SELECT s.name, {_MEANS} FROM catalog_staging s
+    WHERE s.rowid BETWEEN ? AND ? AND NOT EXISTS (SELECT 1 FROM foods f WHERE f.name = s.name) ORDER BY s.rowid
+"""
+
+_MISSING_SQL = "NOT EXISTS (SELECT 1 FROM catalog_staging s WHERE s.name = foods.name)"
+
+
+def read_chunks(csv_path: str, chunk_rows: int = INGEST_CHUNK_ROWS):
+    # Yields one DataFrame per chunk with duplicate names already summed: name, <nutrient sums>, n.
+    for chunk in pd.read_csv(csv_path, usecols=list(CSV_COLUMNS), chunksize=chunk_rows):
+        chunk = chunk.rename(columns=CSV_COLUMNS).dropna(subset=['name'])
+        chunk['name'] = chunk['name'].astype(str)
+        for col in NUTRIENTS: chunk[col] = pd.to_numeric(chunk[col], errors='coerce').fillna(0)
+        chunk['n'] = 1
+        yield len(chunk), chunk.groupby('name', as_index=False, sort=False)[list(NUTRIENTS) + ['n']].sum()
+
+
+def stage_csv(conn: sqlite3.Connection, csv_path: str, chunk_rows: int = INGEST_CHUNK_ROWS) -> int:
+    conn.execute("DROP TABLE IF EXISTS temp.catalog_staging")
+    conn.execute(f"CREATE TEMP TABLE catalog_staging (name TEXT NOT NULL UNIQUE, {', '.join(f'{c} REAL NOT NULL' for c in NUTRIENTS)}, n INTEGER NOT NULL)")
+    source_rows = 0
+    for rows, sums in read_chunks(csv_path, chunk_rows):
+        source_rows += rows
+        with conn: conn.executemany(_STAGE_SQL, sums.itertuples(index=False, name=None))
+    return source_rows
+
+
+def ingest(conn: sqlite3.Connection, csv_path: str, remove_missing: bool = True, dry_run: bool = False,
+           chunk_rows: int = INGEST_CHUNK_ROWS, batch_rows: int = INGEST_BATCH_ROWS) -> dict:
+    # temp_store=FILE so a million-name staging table spills to disk instead of living in the page cache.
+    conn.execute("PRAGMA temp_store = FILE")
+    source_rows = stage_csv(conn, csv_path, chunk_rows)
+    unique = conn.execute("SELECT COUNT(*) FROM catalog_staging").fetchone()[0]
+    if unique == 0: raise ValueError(f"'{csv_path}' has no food rows; refusing to empty the catalog.")
+
+    # Staging rowids are dense (upserts never add one), so fixed rowid ranges make even batches.
+    added = changed = 0
+    for lo in range(1, unique + 1, batch_rows):
+        hi = lo + batch_rows - 1
+        if dry_run:
+            batch_added, batch_changed = conn.execute(_DIFF_SQL, (lo, hi)).fetchone()
+        else:
+            with conn:
+                batch_changed = conn.execute(_UPDATE_SQL, (lo, hi)).rowcount
+                batch_added = conn.execute(_INSERT_SQL, (lo, hi)).rowcount
+        added += batch_added
+        changed += batch_changed
+
+    removed = 0
+    if remove_missing:
+        if dry_run: removed = conn.execute(f"SELECT COUNT(*) FROM foods WHERE {_MISSING_SQL}").fetchone()[0]
+        else:
+            while True:
+                with conn: deleted = conn.execute(f"DELETE FROM foods WHERE id IN (SELECT id FROM foods WHERE {_MISSING_SQL} LIMIT ?)", (batch_rows,)).rowcount
+                if not deleted: break
+                removed += deleted
+    conn.execute("DROP TABLE temp.catalog_staging")
+    return {"source_rows": source_rows, "unique_foods": unique, "added": added, "changed": changed,
+            "unchanged": unique - added - changed, "removed": removed, "dry_run": dry_run}
+
+
+def format_report(report: dict) -> str:
+    prefix = "Dry run, would apply: " if report["dry_run"] else ""
+    return (f"{prefix}{report['source_rows']} CSV rows -> {report['unique_foods']} unique foods: "
+            f"{report['added']} added, {report['changed']} changed, {report['unchanged']} unchanged, {report['removed']} removed.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge a nutrition CSV into the foods table without rebuilding the database.")
+    parser.add_argument("csv", nargs="?", default=CSV_FILENAME)
+    parser.add_argument("--db", default=DB_NAME)
+    parser.add_argument("--dry-run", action="store_true", help="report what would change without writing")
+    parser.add_argument("--keep-missing", action="store_true", help="keep foods that are not in the CSV")
+    parser.add_argument("--chunk-rows", type=int, default=INGEST_CHUNK_ROWS)
+    parser.add_argument("--batch-rows", type=int, default=INGEST_BATCH_ROWS)
+    args = parser.parse_args()
+
+    conn = configure_connection(sqlite3.connect(args.db))
+    try:
+        migrate(conn)
+        report = ingest(conn, args.csv, remove_missing=not args.keep_missing, dry_run=args.dry_run,
+                        chunk_rows=args.chunk_rows, batch_rows=args.batch_rows)
+        print(format_report(report))
+    except (OSError, ValueError) as e:
+        print(f"Ingestion failed: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
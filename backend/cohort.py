@@ -0,0 +1,178 @@
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import numpy as np
+from datetime import date, timedelta
+from db import configure_connection
+from migrations import migrate
+
+# ======================================================
+#  COHORT NUTRITION ANALYTICS (nightly batch job)
+# ======================================================
+# Computes, for every user at once, the calorie goal (BMR x activity, as in
+# calculate_daily_calorie_goal), goal adherence, 7- and 30-day macro averages
+# and surplus/deficit streaks over the last COHORT_WINDOW_DAYS days, and
+# writes one cohort_report row per user for the report date. Users are read
+# in keyset chunks and their daily_totals rows scattered into a dense
+# (users x days x macros) array, so every metric is a NumPy reduction over a
+# whole chunk rather than a Python loop per user. Run it from cron:
+#   python cohort.py [--date YYYY-MM-DD]   (defaults to yesterday)
+
+DB_NAME = 'my_nutrition.db'
+COHORT_WINDOW_DAYS = 30
+COHORT_SHORT_WINDOW_DAYS = 7
+COHORT_CHUNK_USERS = int(os.getenv("COHORT_CHUNK_USERS", "20000"))
+COHORT_ADHERENCE_TOLERANCE = float(os.getenv("COHORT_ADHERENCE_TOLERANCE", "0.10"))  # within +/-10% of goal counts as on target
+COHORT_REPORT_RETENTION_DAYS = int(os.getenv("COHORT_REPORT_RETENTION_DAYS", "90"))  # 0 keeps every report
+STREAK_ALERT_DAYS = 3
+
+ACTIVITY_FACTORS = {'sedentary': 1.2, 'light': 1.375, 'moderate': 1.55, 'active': 1.725, 'very_active': 1.9}
+PROFILE_FIELDS = ('age', 'weight', 'height', 'sex', 'activity_level')
+MACROS = ('calories', 'protein', 'carbs', 'fat')
+
+REPORT_COLUMNS = ('report_date', 'user_id', 'calorie_goal', 'days_logged', 'adherence_rate',
+                  *(f"avg_{m}_{COHORT_SHORT_WINDOW_DAYS}d" for m in MACROS), *(f"avg_{m}_{COHORT_WINDOW_DAYS}d" for m in MACROS),
+                  'surplus_streak', 'deficit_streak', 'longest_surplus_streak', 'longest_deficit_streak')
+
+_INSERT_SQL = f"INSERT OR REPLACE INTO cohort_report ({', '.join(REPORT_COLUMNS)}) VALUES ({', '.join('?' * len(REPORT_COLUMNS))})"
+
+
+def calorie_goals(users) -> np.ndarray:
+    # Vectorised calculate_daily_calorie_goal; NaN (no goal) where the profile is incomplete.
+    complete = users[list(PROFILE_FIELDS)].notna().all(axis=1).to_numpy()
+    weight, height, age = (users[c].to_numpy(float) for c in ('weight', 'height', 'age'))
+    bmr = 10 * weight + 6.25 * height - 5 * age + np.where(users['sex'].to_numpy() == 'male', 5, -161)
+    factor = users['activity_level'].map(ACTIVITY_FACTORS).fillna(1.2).to_numpy(float)
+    return np.where(complete, np.round(bmr * factor), np.nan)
+
+
+def run_lengths(mask: np.ndarray) -> np.ndarray:
+    # Length of the run of consecutive True values ending at each day, per row.
+    counts = np.cumsum(mask, axis=1)
+    return counts - np.maximum.accumulate(np.where(mask, 0, counts), axis=1)
+
+
+def compute_chunk(users, totals, report_date: date, tolerance: float = COHORT_ADHERENCE_TOLERANCE):
+    # users: DataFrame of id (ascending) + profile fields; totals: daily_totals rows for those users within the window.
+    import pandas as pd  # deferred, see run()
+    ids = users['id'].to_numpy()
+    start = np.datetime64(report_date - timedelta(days=COHORT_WINDOW_DAYS - 1), 'D')
+    values = np.zeros((len(ids), COHORT_WINDOW_DAYS, len(MACROS)))
+    logged = np.zeros((len(ids), COHORT_WINDOW_DAYS), dtype=bool)
+    if len(totals):
+        # Older rows may hold non-canonical dates ('2024-1-5') that still fall inside the string BETWEEN window:
+        # parse leniently, drop what doesn't parse or lands outside the window, and sum days that collapse together.
+        dates = pd.to_datetime(totals['log_date'], format='%Y-%m-%d', errors='coerce').to_numpy().astype('datetime64[D]')
+        days = (dates - start).astype(int)
+        # Totals can outlive their user (foreign keys aren't enforced), and searchsorted would hand those to the next id.
+        user_ids = totals['user_id'].to_numpy()
+        rows = np.searchsorted(ids, user_ids).clip(max=len(ids) - 1)
+        keep = ~np.isnat(dates) & (days >= 0) & (days < COHORT_WINDOW_DAYS) & (ids[rows] == user_ids)
+        rows, days = rows[keep], days[keep]
+        np.add.at(values, (rows, days), totals[list(MACROS)].to_numpy(float)[keep])
+        logged[rows, days] = True
+    values[~logged] = np.nan
+    days_logged = logged.sum(axis=1)
+
+    goals = calorie_goals(users)
+    has_goal = goals > 0  # False for NaN too
+    calories = values[:, :, 0]
+    with np.errstate(invalid='ignore'):
+        surplus = logged & has_goal[:, None] & (calories > goals[:, None] * (1 + tolerance))
+        deficit = logged & has_goal[:, None] & (calories < goals[:, None] * (1 - tolerance))
+    on_target = logged & has_goal[:, None] & ~surplus & ~deficit
+    surplus_runs, deficit_runs = run_lengths(surplus), run_lengths(deficit)
+
+    def averages(days: int) -> np.ndarray:
+        # Mean over the days that have any log; days with nothing logged are missing data, not zero intake.
+        mask = logged[:, -days:]
+        sums = np.where(mask[:, :, None], values[:, -days:], 0).sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'): return sums / mask.sum(axis=1)[:, None]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        adherence = np.where(has_goal & (days_logged > 0), on_target.sum(axis=1) / days_logged, np.nan)
+    report = pd.DataFrame({'report_date': report_date.isoformat(), 'user_id': ids, 'calorie_goal': goals,
+                           'days_logged': days_logged, 'adherence_rate': adherence})
+    for days in (COHORT_SHORT_WINDOW_DAYS, COHORT_WINDOW_DAYS):
+        for macro, avg in zip(MACROS, averages(days).T): report[f"avg_{macro}_{days}d"] = np.round(avg, 2)
+    report['surplus_streak'], report['deficit_streak'] = surplus_runs[:, -1], deficit_runs[:, -1]
+    report['longest_surplus_streak'], report['longest_deficit_streak'] = surplus_runs.max(axis=1), deficit_runs.max(axis=1)
+    return report[list(REPORT_COLUMNS)]
+
+
+def _report_rows(report):
+    # object dtype turns numpy scalars into Python ints/floats sqlite3 can bind; NaN becomes NULL.
+    return report.astype(object).where(report.notna(), None).itertuples(index=False, name=None)
+
+
+def run(conn: sqlite3.Connection, report_date: date, chunk_users: int = COHORT_CHUNK_USERS) -> dict:
+    import pandas as pd  # deferred: importing pandas would add startup time and memory to every API worker
+    started = time.perf_counter()
+    day, start = report_date.isoformat(), (report_date - timedelta(days=COHORT_WINDOW_DAYS - 1)).isoformat()
+    with conn:
+        # Drop the finished marker first so the endpoint never serves a half-rewritten report.
+        conn.execute("DELETE FROM cohort_report_runs WHERE report_date = ?", (day,))
+        conn.execute("DELETE FROM cohort_report WHERE report_date = ?", (day,))
+    after, users_total = 0, 0
+    while True:
+        users = pd.read_sql_query(f"SELECT id, {', '.join(PROFILE_FIELDS)} FROM users WHERE id > ? ORDER BY id LIMIT ?", conn, params=(after, chunk_users))
+        if users.empty: break
+        first, last = int(users['id'].iloc[0]), int(users['id'].iloc[-1])
+        totals = pd.read_sql_query(f"SELECT user_id, log_date, {', '.join(MACROS)} FROM daily_totals WHERE user_id BETWEEN ? AND ? AND log_date BETWEEN ? AND ?",
+                                   conn, params=(first, last, start, day))
+        report = compute_chunk(users, totals, report_date)
+        with conn: conn.executemany(_INSERT_SQL, _report_rows(report))
+        after, users_total = last, users_total + len(users)
+    seconds = round(time.perf_counter() - started, 3)
+    with conn:
+        conn.execute("INSERT INTO cohort_report_runs (report_date, users, seconds) VALUES (?, ?, ?)", (day, users_total, seconds))
+        if COHORT_REPORT_RETENTION_DAYS > 0:
+            cutoff = (report_date - timedelta(days=COHORT_REPORT_RETENTION_DAYS)).isoformat()
+            conn.execute("DELETE FROM cohort_report WHERE report_date < ?", (cutoff,))
+            conn.execute("DELETE FROM cohort_report_runs WHERE report_date < ?", (cutoff,))
+    return {"report_date": day, "users": users_total, "seconds": seconds}
+
+
+# --- Reading reports (used by GET /api/reports/cohort) ---
+def find_run(db: sqlite3.Connection, report_date: str | None = None):
+    if report_date: return db.execute("SELECT * FROM cohort_report_runs WHERE report_date = ?", (report_date,)).fetchone()
+    return db.execute("SELECT * FROM cohort_report_runs ORDER BY report_date DESC LIMIT 1").fetchone()
+
+
+def load_report(db: sqlite3.Connection, report_date: str, after_user_id: int, limit: int) -> list[dict]:
+    rows = db.execute(f"SELECT {', '.join(REPORT_COLUMNS[1:])} FROM cohort_report WHERE report_date = ? AND user_id > ? ORDER BY user_id LIMIT ?",
+                      (report_date, after_user_id, limit)).fetchall()
+    return [dict(row) for row in rows]
+
+
+def summarize(db: sqlite3.Connection, report_date: str) -> dict:
+    row = db.execute(f"""
+        SELECT COUNT(*) AS users, IFNULL(SUM(days_logged > 0), 0) AS active_users, AVG(adherence_rate) AS avg_adherence_rate,
+               AVG(avg_calories_{COHORT_SHORT_WINDOW_DAYS}d) AS avg_calories_{COHORT_SHORT_WINDOW_DAYS}d,
+               AVG(avg_calories_{COHORT_WINDOW_DAYS}d) AS avg_calories_{COHORT_WINDOW_DAYS}d,
+               IFNULL(SUM(surplus_streak >= {STREAK_ALERT_DAYS}), 0) AS users_in_surplus_streak,
+               IFNULL(SUM(deficit_streak >= {STREAK_ALERT_DAYS}), 0) AS users_in_deficit_streak
+        FROM cohort_report WHERE report_date = ?""", (report_date,)).fetchone()
+    return dict(row)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compute the nightly cohort nutrition report for every user.")
+    parser.add_argument("--db", default=DB_NAME)
+    parser.add_argument("--date", default=None, help="report date (YYYY-MM-DD); defaults to yesterday, the last complete day")
+    parser.add_argument("--chunk-users", type=int, default=COHORT_CHUNK_USERS)
+    args = parser.parse_args()
+
+    try: report_date = date.fromisoformat(args.date) if args.date else date.today() - timedelta(days=1)
+    except ValueError:
+        print(f"Invalid --date '{args.date}', expected YYYY-MM-DD.")
+        sys.exit(1)
+    conn = configure_connection(sqlite3.connect(args.db))
+    try:
+        migrate(conn)
+        result = run(conn, report_date, args.chunk_users)
+        print(f"Cohort report for {result['report_date']}: {result['users']} users in {result['seconds']}s.")
+    finally:
+        conn.close()
@@ -0,0 +1,180 @@
+import os
+import queue
+import asyncio
+import sqlite3
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from metrics import stage
+
+# ======================================================
+#  SQLITE CONNECTION POOLS (WAL, split readers / writer)
+# ======================================================
+# Connections are opened once, tuned with the PRAGMAs below and reused across
+# requests, along with their prepared-statement caches. In WAL mode readers
+# never block the writer (and vice versa), so reads get their own pool of
+# query-only connections while writes go through a single writer connection
+# (SQLite only ever runs one write transaction at a time).
+
+DB_READER_POOL_SIZE = int(os.getenv("DB_READER_POOL_SIZE", "8"))
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "10"))
+DB_EXPORT_CONNECTIONS = int(os.getenv("DB_EXPORT_CONNECTIONS", "2"))  # concurrent log exports, each on its own connection
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+DB_CACHE_SIZE_KIB = int(os.getenv("DB_CACHE_SIZE_KIB", str(32 * 1024)))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "256"))
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    # Times statement execution (up to the first row) into the per-stage histogram, labelled by verb.
+    def execute(self, sql, parameters=()):
+        with stage(_query_stage(sql)): return super().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        with stage(_query_stage(sql)): return super().executemany(sql, seq_of_parameters)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    def cursor(self, factory=InstrumentedCursor): return super().cursor(factory)
+    def execute(self, sql, parameters=()): return self.cursor().execute(sql, parameters)
+    def executemany(self, sql, seq_of_parameters): return self.cursor().executemany(sql, seq_of_parameters)
+
+
+_QUERY_VERBS = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "PRAGMA"}
+
+def _query_stage(sql: str) -> str:
+    verb = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ""
+    return f"db_{verb.lower()}" if verb in _QUERY_VERBS else "db_other"
+
+
+def configure_connection(conn: sqlite3.Connection, read_only: bool = False) -> sqlite3.Connection:
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}")
+    if not read_only: conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size = -{DB_CACHE_SIZE_KIB}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    if read_only: conn.execute("PRAGMA query_only = 1")
+    return conn
+
+
+class ExportsBusy(sqlite3.OperationalError):
+    pass
+
+
+def open_connection(path: str, read_only: bool = False) -> sqlite3.Connection:
+    # check_same_thread=False: FastAPI may resolve a dependency and run the endpoint on different threads.
+    conn = sqlite3.connect(path, check_same_thread=False, cached_statements=DB_STATEMENT_CACHE_SIZE, factory=InstrumentedConnection)
+    return configure_connection(conn, read_only=read_only)
+
+
+class ConnectionPool:
+    def __init__(self, path: str, size: int, read_only: bool = False, timeout: float = DB_POOL_TIMEOUT_SECONDS):
+        self.path = path
+        self.size = max(1, size)
+        self.read_only = read_only
+        self.timeout = timeout
+        self._idle: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+        self._async_slots = asyncio.Semaphore(self.size)
+
+    def _open(self) -> sqlite3.Connection: return open_connection(self.path, self.read_only)
+
+    def _timed_out(self) -> sqlite3.OperationalError:
+        return sqlite3.OperationalError(f"Timed out waiting for a database connection ({self.size} in use).")
+
+    def try_acquire(self) -> sqlite3.Connection | None:
+        # An idle connection, or a new one while the pool is below size; None when all are in use.
+        try: return self._idle.get_nowait()
+        except queue.Empty: pass
+        with self._lock:
+            grow = self._opened < self.size
+            if grow: self._opened += 1
+        if not grow: return None
+        try: return self._open()
+        except Exception:
+            with self._lock: self._opened -= 1
+            raise
+
+    def acquire(self) -> sqlite3.Connection:
+        conn = self.try_acquire()
+        if conn is not None: return conn
+        try: return self._idle.get(timeout=self.timeout)
+        except queue.Empty: raise self._timed_out()
+
+    async def acquire_async(self) -> sqlite3.Connection:
+        # For FastAPI dependencies: waiters queue on the event loop instead of each parking a worker thread in
+        # acquire(). Sync endpoints share one small thread pool, and if waiters filled it, the requests holding
+        # connections would get no thread to finish on and release them. The semaphore admits at most `size`
+        # callers, so a connection is normally free at once; only when a thread-side caller (database.reader())
+        # has taken it do we block, and then on the default executor rather than the endpoint pool.
+        try: await asyncio.wait_for(self._async_slots.acquire(), self.timeout)
+        except asyncio.TimeoutError: raise self._timed_out()
+        try: return self.try_acquire() or await asyncio.to_thread(self.acquire)
+        except BaseException:
+            self._async_slots.release()
+            raise
+
+    def release_async(self, conn: sqlite3.Connection):
+        self.release(conn)
+        self._async_slots.release()
+
+    def release(self, conn: sqlite3.Connection):
+        try:
+            # Never hand the next request a half-finished transaction.
+            if conn.in_transaction: conn.rollback()
+        except sqlite3.Error:
+            conn.close()
+            with self._lock: self._opened -= 1
+            return
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        with stage("db_acquire"): conn = self.acquire()
+        try: yield conn
+        finally: self.release(conn)
+
+    @asynccontextmanager
+    async def connection_async(self):
+        with stage("db_acquire"): conn = await self.acquire_async()
+        try: yield conn
+        finally: self.release_async(conn)
+
+    def close(self):
+        while True:
+            try: conn = self._idle.get_nowait()
+            except queue.Empty: break
+            conn.close()
+            with self._lock: self._opened -= 1
+
+
+class Database:
+    def __init__(self, path: str, readers: int = DB_READER_POOL_SIZE, exports: int = DB_EXPORT_CONNECTIONS):
+        self.path = path
+        # Exactly one writer, not configurable: with two, a deferred transaction that reads and then writes
+        # fails with SQLITE_BUSY_SNAPSHOT (busy_timeout can't retry it) whenever the other commits in between.
+        self.writers = ConnectionPool(path, 1)
+        self.readers = ConnectionPool(path, readers, read_only=True)
+        self._exports = threading.BoundedSemaphore(max(1, exports))
+
+    def reader(self): return self.readers.connection()
+    def writer(self): return self.writers.connection()
+    def reader_async(self): return self.readers.connection_async()
+    def writer_async(self): return self.writers.connection_async()
+
+    @contextmanager
+    def export_reader(self):
+        # Streams that last as long as a client download get their own short-lived read-only connection, so they
+        # never tie up the request pool's readers; at most `exports` are open at once, beyond that ExportsBusy.
+        if not self._exports.acquire(blocking=False): raise ExportsBusy("Too many exports in progress.")
+        try:
+            conn = open_connection(self.path, read_only=True)
+            try: yield conn
+            finally: conn.close()
+        finally: self._exports.release()
+
+    def close(self):
+        self.readers.close()
+        self.writers.close()
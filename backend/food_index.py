@@ -0,0 +1,140 @@
+import os
+import re
+import sqlite3
+from bisect import bisect_left
+from collections import Counter
+
+# ======================================================
+#  IN-MEMORY FOOD NAME INDEX
+# ======================================================
+# Built once from the `foods` table and swapped atomically on refresh, so
+# lookups never touch SQLite. Matches are ranked in tiers:
+#   exact name > name prefix > word prefix > substring > fuzzy (trigram similarity)
+# and ties go to the shorter (more specific) name.
+
+FOOD_INDEX_REFRESH_SECONDS = float(os.getenv("FOOD_INDEX_REFRESH_SECONDS", "60"))
+FUZZY_MIN_SIMILARITY = 0.3
+
+SCORE_EXACT, SCORE_PREFIX, SCORE_WORD_PREFIX, SCORE_SUBSTRING, SCORE_FUZZY_MAX = 1.0, 0.9, 0.8, 0.7, 0.6
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def normalize(text: str) -> str:
+    return " ".join(_WORD_RE.findall(text.lower()))
+
+
+def trigrams(text: str) -> set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class _Snapshot:
+    def __init__(self, rows: list[dict]):
+        self.rows = rows
+        self.names = [normalize(row['name']) for row in rows]
+        self.exact = {}
+        for i, name in enumerate(self.names): self.exact.setdefault(name, i)
+        # Sorted (word, row) pairs answer both full-name and per-word prefix queries with bisect. They are
+        # bucketed by the length of the full name, the ranking tie-break, so a scan can stop early.
+        self.prefixes: dict[int, list[tuple[str, int]]] = {}
+        self.words: dict[int, list[tuple[str, int]]] = {}
+        for i, name in enumerate(self.names):
+            self.prefixes.setdefault(len(name), []).append((name, i))
+            self.words.setdefault(len(name), []).extend((word, i) for word in set(name.split()))
+        for pairs in (*self.prefixes.values(), *self.words.values()): pairs.sort()
+        self.lengths = sorted(self.prefixes)
+        self.grams: dict[str, list[int]] = {}
+        self.gram_counts = []
+        for i, name in enumerate(self.names):
+            grams = trigrams(name)
+            self.gram_counts.append(len(grams))
+            for g in grams: self.grams.setdefault(g, []).append(i)
+
+
+def _prefix_scan(snap: _Snapshot, buckets: dict[int, list[tuple[str, int]]], q: str, k: int, skip) -> list[int]:
+    # Rows whose key starts with q, in ranking order (shorter name, then name), not in skip. Stops after the
+    # first length bucket that brings the count to k rather than walking and sorting every match.
+    found = []
+    for length in snap.lengths[bisect_left(snap.lengths, len(q)):]:
+        pairs = buckets.get(length, ())
+        hits = set()
+        for j in range(bisect_left(pairs, (q, -1)), len(pairs)):
+            key, i = pairs[j]
+            if not key.startswith(q): break
+            if i not in skip: hits.add(i)
+        found.extend(sorted(hits, key=lambda i: (snap.names[i], i)))
+        if len(found) >= k: break
+    return found
+
+
+class FoodIndex:
+    def __init__(self):
+        self._snapshot = _Snapshot([])
+        self.signature = None
+
+    def __len__(self): return len(self._snapshot.rows)
+
+    @staticmethod
+    def table_signature(db: sqlite3.Connection):
+        # Catalog ingestion updates rows in place, so every nutrient column has to feed the signature.
+        return tuple(db.execute("""SELECT COUNT(*), MAX(rowid), TOTAL(LENGTH(name)), TOTAL(calories), TOTAL(protein), TOTAL(carbs),
+                                          TOTAL(fat), TOTAL(sodium), TOTAL(cholesterol) FROM foods""").fetchone())
+
+    def refresh(self, db: sqlite3.Connection):
+        db.row_factory = sqlite3.Row
+        signature = self.table_signature(db)
+        rows = [dict(row) for row in db.execute("SELECT * FROM foods WHERE name IS NOT NULL")]
+        self._snapshot = _Snapshot(rows)
+        self.signature = signature
+
+    def refresh_if_changed(self, db: sqlite3.Connection) -> bool:
+        if self.table_signature(db) == self.signature: return False
+        self.refresh(db)
+        return True
+
+    def search(self, query: str, k: int = 10, min_score: float = 0.0) -> list[tuple[float, dict]]:
+        snap = self._snapshot
+        q = normalize(query)
+        if not q or k <= 0: return []
+        scores: dict[int, float] = {}
+
+        def offer(i, score):
+            if score > scores.get(i, 0): scores[i] = score
+
+        for i in _prefix_scan(snap, snap.prefixes, q, k, scores): offer(i, SCORE_PREFIX)
+        if q in snap.exact: offer(snap.exact[q], SCORE_EXACT)
+        if len(scores) < k:
+            for i in _prefix_scan(snap, snap.words, q, k - len(scores), scores): offer(i, SCORE_WORD_PREFIX)
+
+        # Substring and fuzzy matches can't outrank k prefix hits, so skip the trigram pass. With fewer
+        # than k hits both scans ran to the end, so every prefix match is already in scores below.
+        if len(scores) >= k: return self._ranked(snap, scores, k, min_score)
+
+        q_grams = trigrams(q)
+        shared = Counter()
+        for g in q_grams: shared.update(snap.grams.get(g, ()))
+        for i, n in shared.items():
+            if i in scores: continue
+            if q in snap.names[i]:
+                offer(i, SCORE_SUBSTRING)
+                continue
+            if min_score > SCORE_FUZZY_MAX: continue
+            similarity = 2 * n / (len(q_grams) + snap.gram_counts[i])
+            if similarity >= FUZZY_MIN_SIMILARITY: offer(i, SCORE_FUZZY_MAX * similarity)
+
+        return self._ranked(snap, scores, k, min_score)
+
+    @staticmethod
+    def _ranked(snap: _Snapshot, scores: dict[int, float], k: int, min_score: float = 0.0):
+        ranked = sorted((item for item in scores.items() if item[1] >= min_score),
+                        key=lambda item: (-item[1], len(snap.names[item[0]]), snap.names[item[0]]))
+        return [(round(score, 4), snap.rows[i]) for i, score in ranked[:k]]
+
+    def best(self, query: str, min_score: float = 0.0) -> dict | None:
+        # min_score=SCORE_SUBSTRING rules out fuzzy matches, for callers that must not act on a guess.
+        snap = self._snapshot
+        i = snap.exact.get(normalize(query))
+        if i is not None: return snap.rows[i]
+        matches = self.search(query, k=1, min_score=min_score)
+        return matches[0][1] if matches else None
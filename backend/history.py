@@ -0,0 +1,111 @@
+import io
+import csv
+import json
+import base64
+import binascii
+
+# ======================================================
+#  LOG HISTORY: STREAMING EXPORT & KEYSET PAGINATION
+# ======================================================
+# Both walk daily_log in (log_date, id) order, which the
+# idx_daily_log_user_date_id index (user_id, log_date + implicit rowid)
+# provides directly, so neither sorts nor materialises a user's history.
+# Export steps a single SQLite statement and yields fixed-size chunks, so memory stays
+# constant however long the history is. Exports run on their own connection
+# (Database.export_reader), never on one of the request pool's readers.
+#
+# Incremental sync: since_id returns entries added after a client's last
+# high_water_id, and deleted_since returns the ids removed after its last
+# deletion_high_water, from tombstones written in the same transaction as the
+# delete (record_deletion).
+
+EXPORT_CHUNK_ROWS = 1000
+LOG_COLUMNS = ('id', 'log_date', 'food_name', 'calories', 'protein', 'carbs', 'fat')
+
+
+def encode_cursor(log_date: str, log_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{log_date}|{log_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[str, int]:
+    try:
+        log_date, log_id = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode().split("|")
+        return log_date, int(log_id)
+    except (ValueError, UnicodeDecodeError, binascii.Error):
+        raise ValueError("Invalid cursor.")
+
+
+def _range_filter(user_id: int, start_date: str | None, end_date: str | None, since_id: int | None):
+    clauses, params = ["user_id = ?"], [user_id]
+    if start_date: clauses.append("log_date >= ?"); params.append(start_date)
+    if end_date: clauses.append("log_date <= ?"); params.append(end_date)
+    if since_id is not None: clauses.append("id > ?"); params.append(since_id)
+    return " AND ".join(clauses), params
+
+
+def fetch_page(db, user_id: int, start_date: str | None, end_date: str | None, after: tuple[str, int] | None, since_id: int | None, limit: int):
+    where, params = _range_filter(user_id, start_date, end_date, since_id)
+    if after is not None:
+        where += " AND (log_date, id) > (?, ?)"
+        params += list(after)
+    rows = db.execute(f"SELECT {', '.join(LOG_COLUMNS)} FROM daily_log WHERE {where} ORDER BY log_date, id LIMIT ?", (*params, limit + 1)).fetchall()
+    items = [dict(row) for row in rows[:limit]]
+    next_cursor = encode_cursor(items[-1]['log_date'], items[-1]['id']) if len(rows) > limit else None
+    return items, next_cursor
+
+
+def high_water_id(db, user_id: int) -> int:
+    # Largest log id the user has; ids only grow, so clients pass it back as since_id to fetch new entries.
+    return db.execute("SELECT IFNULL(MAX(id), 0) FROM daily_log WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+
+def record_deletion(db, user_id: int, log_id: int, log_date: str):
+    db.execute("INSERT INTO daily_log_deletions (user_id, log_id, log_date) VALUES (?, ?, ?)", (user_id, log_id, log_date))
+
+
+def deletion_high_water(db, user_id: int) -> int:
+    return db.execute("SELECT IFNULL(MAX(seq), 0) FROM daily_log_deletions WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+
+def fetch_deletions(db, user_id: int, start_date: str | None, end_date: str | None, deleted_since: int, up_to: int) -> list[int]:
+    # Bounded by up_to, read before the page, so a deletion racing this request is reported by the next sync instead.
+    where, params = _range_filter(user_id, start_date, end_date, None)
+    rows = db.execute(f"SELECT log_id FROM daily_log_deletions WHERE {where} AND seq > ? AND seq <= ? ORDER BY seq", (*params, deleted_since, up_to))
+    return [row[0] for row in rows]
+
+
+def stream_rows(database, user_id: int, start_date: str | None, end_date: str | None, chunk_rows: int = EXPORT_CHUNK_ROWS):
+    # Opens the export's own connection (database.export_reader) and starts the query before returning, so a refused
+    # export (ExportsBusy) surfaces to the endpoint instead of truncating a response that has already begun. Once
+    # started, the generator closes the connection when it finishes or is dropped on client disconnect.
+    rows = _stream_rows(database, user_id, start_date, end_date, chunk_rows)
+    next(rows)
+    return rows
+
+
+def _stream_rows(database, user_id: int, start_date: str | None, end_date: str | None, chunk_rows: int):
+    where, params = _range_filter(user_id, start_date, end_date, None)
+    with database.export_reader() as db:
+        cursor = db.execute(f"SELECT {', '.join(LOG_COLUMNS)} FROM daily_log WHERE {where} ORDER BY log_date, id", params)
+        yield None  # ready; see stream_rows
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows: break
+            yield rows
+
+
+def ndjson_chunks(row_chunks):
+    for rows in row_chunks:
+        yield "".join(json.dumps(dict(zip(LOG_COLUMNS, row)), separators=(",", ":")) + "\n" for row in rows)
+
+
+def csv_chunks(row_chunks):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(LOG_COLUMNS)
+    for rows in row_chunks:
+        writer.writerows(tuple(row) for row in rows)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell(): yield buf.getvalue()
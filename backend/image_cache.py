@@ -0,0 +1,134 @@
+import os
+import time
+import asyncio
+import sqlite3
+import httpx
+from collections import OrderedDict
+from metrics import stage, cache_event
+
+# ======================================================
+#  PEXELS IMAGE LOOKUP (pooled client + two-tier cache)
+# ======================================================
+# Lookups go: in-memory LRU -> `food_images` table on disk -> Pexels API.
+# Entries past their TTL are still served while one background request
+# revalidates them, so a known food never waits on the external API.
+# "No photo found" is cached too, with its own (shorter) TTL. The table is
+# created by migration 2 (see migrations.py).
+
+PEXELS_API_URL = os.getenv("PEXELS_API_URL", "https://api.pexels.com/v1/search")
+IMAGE_CACHE_SIZE = int(os.getenv("IMAGE_CACHE_SIZE", "1024"))
+IMAGE_CACHE_TTL_SECONDS = float(os.getenv("IMAGE_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+IMAGE_CACHE_NEGATIVE_TTL_SECONDS = float(os.getenv("IMAGE_CACHE_NEGATIVE_TTL_SECONDS", str(24 * 3600)))
+# API failures are remembered only in memory and only briefly, so an outage doesn't hammer Pexels.
+IMAGE_CACHE_ERROR_TTL_SECONDS = 60.0
+
+_MISSING = object()
+
+
+class PexelsImageService:
+    def __init__(self, api_key: str | None, database, transport: httpx.AsyncBaseTransport | None = None,
+                 cache_size: int = IMAGE_CACHE_SIZE, ttl: float = IMAGE_CACHE_TTL_SECONDS,
+                 negative_ttl: float = IMAGE_CACHE_NEGATIVE_TTL_SECONDS):
+        self.api_key = api_key
+        self.database = database
+        self.transport = transport
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._memory: OrderedDict[str, tuple[str | None, float]] = OrderedDict()  # key -> (url, expires_at)
+        self._inflight: dict[str, asyncio.Task] = {}
+        self._client: httpx.AsyncClient | None = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                transport=self.transport, headers={"Authorization": self.api_key or ""}, timeout=httpx.Timeout(5.0),
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10))
+        return self._client
+
+    async def aclose(self):
+        for task in list(self._inflight.values()): task.cancel()
+        if self._client is not None: await self._client.aclose()
+        self._client = None
+
+    @staticmethod
+    def cache_key(food_name: str) -> str:
+        return " ".join(food_name.lower().split())
+
+    async def get(self, food_name: str) -> str | None:
+        if not self.api_key: return None
+        key = self.cache_key(food_name)
+        cached = self._memory_get(key)
+        if cached is _MISSING:
+            cached = await asyncio.to_thread(self._disk_get, key)
+            if cached is not _MISSING:
+                self._memory_put(key, *cached)
+                cache_event("pexels_image", "disk_hit")
+        else: cache_event("pexels_image", "memory_hit")
+        if cached is _MISSING:
+            cache_event("pexels_image", "miss")
+            return await self._refresh(key)
+        url, expires_at = cached
+        if expires_at <= time.time() and key not in self._inflight:
+            cache_event("pexels_image", "stale")
+            # Stale: answer now, revalidate in the background.
+            self._inflight[key] = task = asyncio.create_task(self._fetch_and_store(key))
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return url
+
+    async def _refresh(self, key: str) -> str | None:
+        # Concurrent misses for the same food share one API request.
+        task = self._inflight.get(key)
+        if task is None:
+            self._inflight[key] = task = asyncio.create_task(self._fetch_and_store(key))
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _fetch_and_store(self, key: str) -> str | None:
+        params = {"query": key, "per_page": 1, "size": "medium"}
+        try:
+            with stage("pexels_api"): r = await self.client.get(PEXELS_API_URL, params=params)
+            r.raise_for_status()
+            photos = r.json().get('photos') or []
+            url = photos[0]['src']['medium'] if photos else None
+        except Exception as e:
+            print(f"Pexels API error: {e}")
+            stale = self._memory.get(key)
+            if stale is not None:
+                # Keep serving the last known answer rather than dropping it on a transient error.
+                self._memory_put(key, stale[0], time.time() + IMAGE_CACHE_ERROR_TTL_SECONDS)
+                return stale[0]
+            self._memory_put(key, None, time.time() + IMAGE_CACHE_ERROR_TTL_SECONDS)
+            return None
+        expires_at = time.time() + (self.ttl if url else self.negative_ttl)
+        self._memory_put(key, url, expires_at)
+        try: await asyncio.to_thread(self._disk_put, key, url, expires_at)
+        except sqlite3.Error as e: print(f"Image cache write error: {e}")
+        return url
+
+    # --- Memory tier ---
+    def _memory_get(self, key: str):
+        entry = self._memory.get(key, _MISSING)
+        if entry is not _MISSING: self._memory.move_to_end(key)
+        return entry
+
+    def _memory_put(self, key: str, url: str | None, expires_at: float):
+        self._memory[key] = (url, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.cache_size: self._memory.popitem(last=False)
+
+    # --- Disk tier ---
+    def _disk_get(self, key: str):
+        # A failed read is a miss, like a failed write in _disk_put: the cache must never fail the request.
+        try:
+            with self.database.reader() as db:
+                row = db.execute("SELECT image_url, expires_at FROM food_images WHERE food_name = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            print(f"Image cache read error: {e}")
+            return _MISSING
+        return tuple(row) if row else _MISSING
+
+    def _disk_put(self, key: str, url: str | None, expires_at: float):
+        with self.database.writer() as db, db:
+            db.execute("INSERT OR REPLACE INTO food_images (food_name, image_url, expires_at) VALUES (?, ?, ?)", (key, url, expires_at))
@@ -0,0 +1,143 @@
+import os
+import asyncio
+import time
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+# ======================================================
+#  MODEL LOADING (deferred, off the event loop)
+# ======================================================
+# TensorFlow is imported and keras_model.h5 loaded on a background thread
+# after the server starts, followed by one dummy prediction so graph setup
+# isn't paid by the first real request. Until then every non-ML endpoint
+# serves normally and identify requests get a retryable 503.
+# MODEL_LOAD_MODE=blocking restores loading before the server accepts traffic.
+
+MODEL_PATH = os.getenv("MODEL_PATH", "keras_model.h5")
+LABELS_PATH = os.getenv("LABELS_PATH", "labels.txt")
+MODEL_LOAD_MODE = os.getenv("MODEL_LOAD_MODE", "background")
+MODEL_INPUT_SIZE = (224, 224)
+
+MODEL_NOT_LOADED, MODEL_LOADING, MODEL_READY, MODEL_FAILED = "not_loaded", "loading", "ready", "failed"
+
+
+class ModelLoader:
+    def __init__(self, model_path: str = MODEL_PATH, labels_path: str = LABELS_PATH):
+        self.model_path = model_path
+        self.labels_path = labels_path
+        self.model = None
+        self.class_labels: list[str] = []
+        self.state = MODEL_NOT_LOADED
+        self.error: str | None = None
+        self.load_seconds: float | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool: return self.state == MODEL_READY
+
+    def load(self):
+        with self._lock:
+            if self.state in (MODEL_READY, MODEL_LOADING): return
+            self.state = MODEL_LOADING
+        started = time.perf_counter()
+        print("Loading Keras AI model...")
+        try:
+            import tensorflow as tf  # deferred: importing TensorFlow alone takes seconds
+            model = tf.keras.models.load_model(self.model_path, compile=False)
+            with open(self.labels_path, 'r') as f:
+                class_labels = [line.strip().split(' ', 1)[1] for line in f]
+            # Warm-up: the first call builds the graph; do it here instead of on a user's request.
+            model.predict_on_batch(np.zeros((1, *MODEL_INPUT_SIZE, 3), dtype=np.float32))
+        except Exception as e:
+            self.state, self.error = MODEL_FAILED, str(e)
+            print(f"\nERROR: Could not load '{self.model_path}' or '{self.labels_path}' ({e}). Image recognition will fail.\n")
+            return
+        self.model, self.class_labels = model, class_labels
+        self.load_seconds = round(time.perf_counter() - started, 3)
+        self.state = MODEL_READY
+        print(f"AI Model and labels loaded successfully in {self.load_seconds}s.")
+
+    async def start(self):
+        if MODEL_LOAD_MODE == "blocking": await asyncio.to_thread(self.load)
+        else: asyncio.get_running_loop().run_in_executor(None, self.load)
+
+    def predict_batch(self, batch: np.ndarray) -> np.ndarray:
+        return np.asarray(self.model.predict_on_batch(batch))
+
+    def status(self) -> dict:
+        return {"state": self.state, "error": self.error, "load_seconds": self.load_seconds, "labels": len(self.class_labels)}
+
+# ======================================================
+#  MICRO-BATCHING INFERENCE SCHEDULER
+# ======================================================
+# Concurrent /api/food/identify requests are queued here and grouped into a
+# single model call, bounded by max_batch_size and max_wait_ms. The model runs
+# on a dedicated worker thread so the event loop keeps serving other endpoints.
+
+INFERENCE_MAX_BATCH_SIZE = int(os.getenv("INFERENCE_MAX_BATCH_SIZE", "16"))
+INFERENCE_MAX_WAIT_MS = float(os.getenv("INFERENCE_MAX_WAIT_MS", "5"))
+
+
+class InferenceBatcher:
+    def __init__(self, predict_fn, max_batch_size: int = INFERENCE_MAX_BATCH_SIZE, max_wait_ms: float = INFERENCE_MAX_WAIT_MS):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self._executor: ThreadPoolExecutor | None = None
+
+    async def start(self):
+        if self._task is not None: return
+        self._queue = asyncio.Queue()
+        # One worker: Keras is not re-entrant, and batching already gives us the parallelism.
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None: return
+        self._task.cancel()
+        try: await self._task
+        except asyncio.CancelledError: pass
+        self._task = None
+        # Anything still queued will never be served; fail it instead of hanging the caller.
+        while not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done(): future.set_exception(RuntimeError("Inference scheduler stopped."))
+        self._executor.shutdown(wait=False)
+        self._executor = None
+
+    async def predict(self, image_array: np.ndarray) -> np.ndarray:
+        # Queue one preprocessed (H, W, C) image and wait for its own prediction vector.
+        if self._task is None: await self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((image_array, future))
+        return await future
+
+    async def _collect_batch(self):
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0: break
+            try: batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError: break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect_batch()
+            # Callers that gave up (client disconnect) don't need a slot in the batch.
+            batch = [(x, f) for x, f in batch if not f.cancelled()]
+            if not batch: continue
+            inputs = np.stack([x for x, _ in batch])
+            try:
+                predictions = await loop.run_in_executor(self._executor, self.predict_fn, inputs)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done(): future.set_exception(e)
+                continue
+            for (_, future), prediction in zip(batch, predictions):
+                if not future.done(): future.set_result(prediction)
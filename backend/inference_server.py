@@ -0,0 +1,271 @@
+import os
+import sys
+import signal
+import asyncio
+import argparse
+import itertools
+import threading
+import numpy as np
+import multiprocessing
+from multiprocessing import shared_memory
+from multiprocessing.connection import Client, Listener, AuthenticationError
+from inference import InferenceBatcher, ModelLoader, MODEL_FAILED, MODEL_INPUT_SIZE, MODEL_LOADING, MODEL_NOT_LOADED, MODEL_READY
+
+# ======================================================
+#  OUT-OF-PROCESS INFERENCE SERVER
+# ======================================================
+# With several uvicorn workers, each one would otherwise import TensorFlow and
+# hold its own copy of the model. Instead, run
+#   python inference_server.py --address /tmp/nutriscan-inference.sock --processes 2
+# and start the API with INFERENCE_SERVER_ADDRESS pointing at the same socket.
+# Model processes share one listening socket (the kernel spreads connections
+# across them) and micro-batch requests from every API worker together.
+#
+# Each API worker allocates a shared-memory block of INFERENCE_SERVER_SLOTS
+# input-sized slots and tells the server its name once; after that a request
+# is just (request id, slot) and the reply is the small prediction vector, so
+# pixel buffers are never pickled or copied through the socket.
+#
+# Messages on the socket are pickles, so whoever can connect can run code in
+# the model process. The socket is created owner-only (0600), and both sides
+# must share INFERENCE_SERVER_AUTHKEY, a secret with no default, e.g.
+#   export INFERENCE_SERVER_AUTHKEY=$(python -c "import secrets; print(secrets.token_hex(32))")
+
+INFERENCE_SERVER_ADDRESS = os.getenv("INFERENCE_SERVER_ADDRESS", "")  # unix socket path; empty = in-process model
+INFERENCE_SERVER_AUTHKEY = os.getenv("INFERENCE_SERVER_AUTHKEY", "").encode()  # required, see above
+INFERENCE_SERVER_PROCESSES = int(os.getenv("INFERENCE_SERVER_PROCESSES", "1"))
+INFERENCE_SERVER_SLOTS = int(os.getenv("INFERENCE_SERVER_SLOTS", "32"))
+INFERENCE_SERVER_RETRY_SECONDS = 1.0
+INFERENCE_SERVER_TIMEOUT_SECONDS = float(os.getenv("INFERENCE_SERVER_TIMEOUT_SECONDS", "30"))  # per request, waiting for a slot included
+
+INPUT_SHAPE = (MODEL_INPUT_SIZE[1], MODEL_INPUT_SIZE[0], 3)
+SLOT_BYTES = int(np.prod(INPUT_SHAPE)) * np.dtype(np.float32).itemsize
+
+
+class InferenceUnavailable(RuntimeError):
+    pass
+
+
+def _slot_view(shm: shared_memory.SharedMemory, slot: int) -> np.ndarray:
+    return np.ndarray(INPUT_SHAPE, dtype=np.float32, buffer=shm.buf, offset=slot * SLOT_BYTES)
+
+
+def _require_authkey():
+    if not INFERENCE_SERVER_AUTHKEY: raise RuntimeError("INFERENCE_SERVER_AUTHKEY must be set to a shared secret to use the inference server.")
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    # The API worker owns the block; don't let this process's resource tracker unlink it on exit.
+    if sys.version_info >= (3, 13): return shared_memory.SharedMemory(name=name, track=False)
+    shm = shared_memory.SharedMemory(name=name)
+    from multiprocessing import resource_tracker
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+# --- Server (model process) ---
+def _serve_connection(conn, loader: ModelLoader, batcher: InferenceBatcher, loop: asyncio.AbstractEventLoop):
+    send_lock = threading.Lock()
+
+    def reply(message):
+        with send_lock:
+            try: conn.send(message)
+            except (OSError, ValueError): pass  # client went away; its reader sees EOF
+
+    shm = None
+    try:
+        _, shm_name, slots = conn.recv()
+        shm = _attach(shm_name)
+        reply(("hello", loader.status(), loader.class_labels))
+        while True:
+            request_id, slot = conn.recv()
+            if not 0 <= slot < slots:
+                reply((request_id, None, f"Invalid slot {slot}."))
+                continue
+            future = asyncio.run_coroutine_threadsafe(batcher.predict(_slot_view(shm, slot)), loop)
+            # The batcher stacks the slot into its batch before predicting, so replying also frees the slot.
+            future.add_done_callback(lambda f, request_id=request_id: reply(
+                (request_id, None, str(f.exception())) if f.exception() else (request_id, np.asarray(f.result(), dtype=np.float32), None)))
+    except (EOFError, OSError, ValueError): pass
+    finally:
+        conn.close()
+        if shm is not None:
+            try: shm.close()
+            except BufferError: pass  # a queued slot view still references it; released when that request finishes
+
+
+def serve(listener: Listener):
+    # One model process: loads its own model, then accepts API workers on the shared listening socket.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the parent handles Ctrl-C and terminates us
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    loader = ModelLoader()
+    loader.load()
+    loop = asyncio.new_event_loop()
+    batcher = InferenceBatcher(loader.predict_batch)
+    loop.run_until_complete(batcher.start())
+    threading.Thread(target=loop.run_forever, name="inference-loop", daemon=True).start()
+    print(f"Inference process {os.getpid()} {loader.state}, accepting connections.")
+    while True:
+        try: conn = listener.accept()
+        except (OSError, EOFError, AuthenticationError) as e:
+            print(f"Inference server rejected a connection: {e}")
+            continue
+        threading.Thread(target=_serve_connection, args=(conn, loader, batcher, loop), daemon=True).start()
+
+
+def run_server(address: str, processes: int = INFERENCE_SERVER_PROCESSES):
+    _require_authkey()
+    if os.path.exists(address): os.unlink(address)  # stale socket from a previous run
+    # Owner-only from the moment it is bound (umask), and explicitly so afterwards.
+    umask = os.umask(0o177)
+    try: listener = Listener(address, family="AF_UNIX", authkey=INFERENCE_SERVER_AUTHKEY)
+    finally: os.umask(umask)
+    os.chmod(address, 0o600)
+    # fork, so children inherit the listening socket; TensorFlow is only ever imported inside the children.
+    context = multiprocessing.get_context("fork")
+    children = [context.Process(target=serve, args=(listener,), name=f"inference-{i}", daemon=True) for i in range(max(1, processes))]
+    for child in children: child.start()
+    print(f"Inference server listening on {address} with {len(children)} model process(es).")
+    # Turn SIGTERM into a normal exit so the model processes are stopped with us rather than orphaned.
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        for child in children: child.join()
+    except KeyboardInterrupt: pass
+    finally:
+        for child in children: child.terminate()
+        listener.close()
+
+
+# --- Client (API worker) ---
+class InferenceClient:
+    # Stands in for both ModelLoader (state, class_labels, status) and InferenceBatcher (start/stop/predict).
+    def __init__(self, address: str = INFERENCE_SERVER_ADDRESS, slots: int = INFERENCE_SERVER_SLOTS):
+        _require_authkey()
+        self.address = address
+        self.slots = max(1, slots)
+        self.state = MODEL_NOT_LOADED
+        self.error: str | None = None
+        self.load_seconds: float | None = None
+        self.class_labels: list[str] = []
+        self._conn = None
+        self._shm: shared_memory.SharedMemory | None = None
+        self._free: asyncio.Queue | None = None
+        self._pending: dict[int, tuple[asyncio.Future, int]] = {}
+        self._ids = itertools.count()
+        self._task: asyncio.Task | None = None
+        self._disconnected: asyncio.Event | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    @property
+    def ready(self) -> bool: return self.state == MODEL_READY
+
+    async def start(self):
+        if self._task is not None: return
+        self._loop = asyncio.get_running_loop()
+        self._shm = shared_memory.SharedMemory(create=True, size=self.slots * SLOT_BYTES)
+        self._free = asyncio.Queue()
+        for slot in range(self.slots): self._free.put_nowait(slot)
+        self._disconnected = asyncio.Event()
+        self.state = MODEL_LOADING
+        self._task = asyncio.create_task(self._connect_loop())
+
+    async def stop(self):
+        if self._task is None: return
+        self._task.cancel()
+        try: await self._task
+        except asyncio.CancelledError: pass
+        self._task = None
+        conn, self._conn = self._conn, None
+        if conn is not None: conn.close()
+        self._fail_pending("Inference client stopped.")
+        try: self._shm.close()
+        except BufferError: pass
+        self._shm.unlink()
+        self._shm = None
+        self.state = MODEL_NOT_LOADED
+
+    async def _connect_loop(self):
+        while True:
+            try: await asyncio.to_thread(self._connect)
+            except (OSError, EOFError, AuthenticationError) as e:
+                self.error = f"Inference server at {self.address} unavailable: {e}"
+                await asyncio.sleep(INFERENCE_SERVER_RETRY_SECONDS)
+                continue
+            await self._disconnected.wait()
+            self._disconnected.clear()
+
+    def _connect(self):
+        conn = Client(self.address, family="AF_UNIX", authkey=INFERENCE_SERVER_AUTHKEY)
+        conn.send(("hello", self._shm.name, self.slots))
+        _, status, labels = conn.recv()
+        self.class_labels, self.load_seconds = labels, status.get("load_seconds")
+        self.state, self.error = (MODEL_READY, None) if status["state"] == MODEL_READY else (MODEL_FAILED, status.get("error"))
+        self._conn = conn
+        threading.Thread(target=self._read_replies, args=(conn,), name="inference-client", daemon=True).start()
+        print(f"Connected to inference server at {self.address} ({status['state']}).")
+
+    def _read_replies(self, conn):
+        try:
+            while True: self._loop.call_soon_threadsafe(self._resolve, *conn.recv())
+        except (EOFError, OSError): pass
+        try: self._loop.call_soon_threadsafe(self._on_disconnect, conn)
+        except RuntimeError: pass  # event loop already closed
+
+    def _resolve(self, request_id: int, prediction, error):
+        entry = self._pending.pop(request_id, None)
+        if entry is None: return
+        future, slot = entry
+        self._free.put_nowait(slot)
+        if future.done(): return
+        if error is None: future.set_result(prediction)
+        else: future.set_exception(RuntimeError(error))
+
+    def _on_disconnect(self, conn):
+        if conn is not self._conn: return
+        self._conn = None
+        if self._task is None: return
+        print(f"Lost connection to inference server at {self.address}; reconnecting.")
+        self.state, self.error = MODEL_LOADING, "Inference server disconnected."
+        self._fail_pending("Inference server disconnected.")
+        self._disconnected.set()
+
+    def _fail_pending(self, detail: str):
+        for future, slot in self._pending.values():
+            self._free.put_nowait(slot)
+            if not future.done(): future.set_exception(InferenceUnavailable(detail))
+        self._pending.clear()
+
+    async def predict(self, image_array: np.ndarray) -> np.ndarray:
+        if self._conn is None or not self.ready: raise InferenceUnavailable("Inference server is not connected.")
+        # A model process can stall without closing its socket; don't let requests (and their slots) wait forever.
+        deadline = self._loop.time() + INFERENCE_SERVER_TIMEOUT_SECONDS
+        try: slot = await asyncio.wait_for(self._free.get(), INFERENCE_SERVER_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError: raise InferenceUnavailable("Inference server is busy; no free input slot.")
+        # A slot is only handed back when its reply arrives, so the server never reads a reused buffer.
+        _slot_view(self._shm, slot)[...] = image_array
+        request_id = next(self._ids)
+        future = self._loop.create_future()
+        self._pending[request_id] = (future, slot)
+        try: self._conn.send((request_id, slot))
+        except (OSError, AttributeError, ValueError):
+            self._pending.pop(request_id, None)
+            self._free.put_nowait(slot)
+            raise InferenceUnavailable("Inference server is not connected.")
+        # On timeout the slot stays reserved in _pending: the server may still read it, and a late reply (or a
+        # disconnect) is what frees it. wait_for cancels the future, so that late reply is simply dropped.
+        try: return await asyncio.wait_for(future, max(0.0, deadline - self._loop.time()))
+        except asyncio.TimeoutError: raise InferenceUnavailable(f"Inference server did not answer within {INFERENCE_SERVER_TIMEOUT_SECONDS:g}s.")
+
+    def status(self) -> dict:
+        return {"state": self.state, "error": self.error, "load_seconds": self.load_seconds, "labels": len(self.class_labels), "server": self.address}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the food recognition model to API workers over a local socket.")
+    parser.add_argument("--address", default=INFERENCE_SERVER_ADDRESS or "/tmp/nutriscan-inference.sock")
+    parser.add_argument("--processes", type=int, default=INFERENCE_SERVER_PROCESSES)
+    args = parser.parse_args()
+    try: run_server(args.address, args.processes)
+    except RuntimeError as e:
+        print(e)
+        sys.exit(1)
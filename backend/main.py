@@ -2,24 +2,37 @@
 import os
 import sqlite3
 import random
+import asyncio
 import uuid
-import pandas as pd
 import numpy as np
-import httpx
-import tensorflow as tf
-from PIL import Image
-from io import BytesIO
 from datetime import datetime, timedelta
 import calendar
 from typing import List, Annotated
 from enum import Enum
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
 
 # --- FastAPI & Pydantic Imports ---
-from fastapi import Depends, FastAPI, HTTPException, status, UploadFile, File
+from fastapi import Depends, FastAPI, HTTPException, status, UploadFile, File, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, EmailStr
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, EmailStr, Field
 from dotenv import load_dotenv
 
+from db import Database, ExportsBusy
+from metrics import MetricsMiddleware, stage, render_latest, INFERENCE_BATCH_SIZE, INFERENCE_IN_FLIGHT, METRICS_ENABLED
+from auth_cache import PrincipalCache
+from migrations import migrate
+from inference import InferenceBatcher, ModelLoader, MODEL_FAILED, MODEL_INPUT_SIZE
+from inference_server import InferenceClient, InferenceUnavailable, INFERENCE_SERVER_ADDRESS
+from preprocessing import ImagePreprocessor, ImageRejected, UploadLimitMiddleware, MAX_UPLOAD_BYTES
+from prediction_cache import PredictionCache, content_key, dhash
+import rollup
+import history
+import cohort
+from food_index import FoodIndex, FOOD_INDEX_REFRESH_SECONDS, SCORE_SUBSTRING
+from image_cache import PexelsImageService
+
 # --- Security & Authentication Imports ---
 from jose import JWTError, jwt
 from passlib.context import CryptContext
@@ -31,27 +44,52 @@ from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 
 load_dotenv()
 
+DB_NAME = os.getenv("DB_PATH", 'my_nutrition.db')
+DB_MIGRATE_ON_STARTUP = os.getenv("DB_MIGRATE_ON_STARTUP", "1") == "1"
+database = Database(DB_NAME)
+
 # --- Security Configuration ---
 SECRET_KEY = os.getenv("SECRET_KEY", "a_very_strong_secret_key_for_jwt_in_development")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # Token expires in 1 day
+MAX_SUMMARY_RANGE_DAYS = 366
+MAX_BULK_LOG_ITEMS = 500
+MAX_LOG_PAGE_SIZE = 1000
+# Logging records a food's nutrients, so it only accepts substring-or-better name matches; fuzzy ones stay in search/suggest.
+LOG_MIN_MATCH_SCORE = SCORE_SUBSTRING
+EXPORT_RETRY_AFTER_SECONDS = 5
+# Usernames allowed to read the all-user cohort report (comma-separated); empty means nobody.
+COHORT_REPORT_USERS = {u.strip() for u in os.getenv("COHORT_REPORT_USERS", "").split(",") if u.strip()}
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/users/login")
-
-# --- AI Model Loading ---
-print("Loading Keras AI model...")
-model = None
-class_labels = []
-try:
-    model = tf.keras.models.load_model('keras_model.h5', compile=False)
-    with open('labels.txt', 'r') as f:
-        class_labels = [line.strip().split(' ', 1)[1] for line in f]
-    print("AI Model and labels loaded successfully.")
-except IOError:
-    print("\nERROR: Could not find 'keras_model.h5' or 'labels.txt'. Image recognition will fail.\n")
+# bcrypt is deliberately slow; run it on a small bounded pool so logins never stall the event loop
+AUTH_HASH_WORKERS = int(os.getenv("AUTH_HASH_WORKERS", "4"))
+password_executor = ThreadPoolExecutor(max_workers=AUTH_HASH_WORKERS, thread_name_prefix="bcrypt")
+# Opt-in: carry the profile fields in the JWT so authenticated requests need no user lookup at all.
+# Such tokens reflect the profile as of issue time; profile updates hand back a fresh one in X-Access-Token.
+AUTH_PROFILE_IN_TOKEN = os.getenv("AUTH_PROFILE_IN_TOKEN", "0") == "1"
+TOKEN_PROFILE_FIELDS = ('id', 'username', 'email', 'age', 'weight', 'height', 'sex', 'activity_level')
+principal_cache = PrincipalCache()
+
+# --- AI Model Loading (deferred to startup, see inference.py) ---
+MODEL_RETRY_AFTER_SECONDS = 5
+MAX_TOP_K = 10
+def predict_batch(batch: np.ndarray) -> np.ndarray:
+    INFERENCE_BATCH_SIZE.observe(len(batch))
+    with stage("model_predict"): return model_loader.predict_batch(batch)
+
+if INFERENCE_SERVER_ADDRESS:
+    # Shared inference server (see inference_server.py): this worker never imports TensorFlow.
+    model_loader = inference_batcher = InferenceClient(INFERENCE_SERVER_ADDRESS)
+else:
+    model_loader = ModelLoader()
+    inference_batcher = InferenceBatcher(predict_batch)
+image_preprocessor = ImagePreprocessor(MODEL_INPUT_SIZE)
+prediction_cache = PredictionCache()
 
 # --- Pexels API Configuration ---
 PEXELS_API_KEY = os.getenv("PEXELS_API_KEY")
+image_service = PexelsImageService(PEXELS_API_KEY, database)
 
 # ======================================================
 #  2. HELPER FUNCTIONS (Security & Core Logic)
@@ -60,16 +98,41 @@ PEXELS_API_KEY = os.getenv("PEXELS_API_KEY")
 def verify_password(plain_password, hashed_password): return pwd_context.verify(plain_password, hashed_password)
 def get_password_hash(password): return pwd_context.hash(password)
 
+async def verify_password_async(plain_password, hashed_password):
+    with stage("bcrypt_verify"):
+        return await asyncio.get_running_loop().run_in_executor(password_executor, verify_password, plain_password, hashed_password)
+
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-def get_db():
-    db = sqlite3.connect('my_nutrition.db', check_same_thread=False); db.row_factory = sqlite3.Row
-    try: yield db
-    finally: db.close()
+def run_migrations():
+    with database.writer() as db: migrate(db)
+
+# async so that requests waiting for a connection wait on the event loop, not on a worker thread (see ConnectionPool.acquire_async)
+async def get_db():
+    async with database.reader_async() as db: yield db
+
+async def get_db_writer():
+    async with database.writer_async() as db: yield db
+
+# --- Food Name Index ---
+food_index = FoodIndex()
+
+def refresh_food_index(only_if_changed: bool = False) -> bool:
+    with database.reader() as db:
+        if only_if_changed: return food_index.refresh_if_changed(db)
+        food_index.refresh(db)
+        return True
+
+async def keep_food_index_fresh():
+    while True:
+        await asyncio.sleep(FOOD_INDEX_REFRESH_SECONDS)
+        try:
+            if await asyncio.to_thread(refresh_food_index, True): print(f"Food index refreshed ({len(food_index)} items).")
+        except sqlite3.Error as e: print(f"Food index refresh error: {e}")
 
 def calculate_daily_calorie_goal(profile: dict) -> float:
     if not all(k in profile and profile[k] is not None for k in ['age', 'weight', 'height', 'sex', 'activity_level']):
@@ -78,20 +141,16 @@ def calculate_daily_calorie_goal(profile: dict) -> float:
         bmr = (10 * profile['weight']) + (6.25 * profile['height']) - (5 * profile['age']) + 5
     else:
         bmr = (10 * profile['weight']) + (6.25 * profile['height']) - (5 * profile['age']) - 161
-    activity_factors = {'sedentary': 1.2, 'light': 1.375, 'moderate': 1.55, 'active': 1.725, 'very_active': 1.9}
-    return round(bmr * activity_factors.get(profile['activity_level'], 1.2))
+    return round(bmr * cohort.ACTIVITY_FACTORS.get(profile['activity_level'], 1.2))
 
 async def get_food_image_url(food_name: str):
-    if not PEXELS_API_KEY: return None
-    headers = {"Authorization": PEXELS_API_KEY}
-    params = {"query": food_name, "per_page": 1, "size": "medium"}
-    async with httpx.AsyncClient() as client:
-        try:
-            r = await client.get("https://api.pexels.com/v1/search", headers=headers, params=params)
-            r.raise_for_status()
-            if r.json()['photos']: return r.json()['photos'][0]['src']['medium']
-        except Exception as e: print(f"Pexels API error: {e}")
-    return None
+    return await image_service.get(food_name)
+
+def load_foods_by_name(names: list[str]) -> dict[str, dict]:
+    # One indexed query (idx_foods_name is NOCASE) for all names, keyed by lower-cased name.
+    with database.reader() as db:
+        rows = db.execute(f"SELECT * FROM foods WHERE name COLLATE NOCASE IN ({', '.join('?' * len(names))})", names).fetchall()
+    return {row['name'].lower(): dict(row) for row in rows}
 
 
 # ======================================================
@@ -110,6 +169,15 @@ class TokenData(BaseModel): username: str | None = None
 class FoodResponse(BaseModel): name: str; calories: float; protein: float; carbs: float; fat: float; sodium: float; cholesterol: float; image_url: str | None = None
 class LoggedItem(BaseModel): id: int; log_date: str; food_name: str; calories: float; protein: float; carbs: float; fat: float
 class DailyLogResponse(BaseModel): items: List[LoggedItem]; total_calories: float
+class BulkLogItem(BaseModel): food_name: str; log_date: str | None = None; quantity: float = Field(1.0, gt=0, le=100); client_key: str | None = Field(None, max_length=128)
+class BulkLogRequest(BaseModel): items: List[BulkLogItem] = Field(..., min_length=1, max_length=MAX_BULK_LOG_ITEMS)
+class BulkLogError(BaseModel): index: int; food_name: str; detail: str
+class BulkLogResponse(BaseModel): items: List[LoggedItem]; errors: List[BulkLogError]
+class LogPage(BaseModel): items: List[LoggedItem]; next_cursor: str | None = None; high_water_id: int; deleted_ids: List[int] = []; deletion_high_water: int
+class ExportFormat(str, Enum): ndjson = "ndjson"; csv = "csv"
+class LabelPrediction(BaseModel): label: str; confidence: float; food: FoodResponse | None = None
+class TopPredictionsResponse(BaseModel): predictions: List[LabelPrediction]
+class FoodSuggestion(BaseModel): name: str; calories: float; protein: float; carbs: float; fat: float; score: float
 class TipsResponse(BaseModel): tips: list[str]
 
 class WeeklySummaryRequest(BaseModel): date_str: str
@@ -117,6 +185,18 @@ class MonthlySummaryRequest(BaseModel): year: int; month: int
 class CalorieAnalysisData(BaseModel): date: str; total_calories: float; excess_calories: float; calorie_goal: float
 class WeeklySummaryResponse(BaseModel): data: List[CalorieAnalysisData]
 class MonthlySummaryResponse(BaseModel): data: List[CalorieAnalysisData]
+class RangeSummaryRequest(BaseModel): start_date: str; end_date: str
+class NutritionAnalysisData(CalorieAnalysisData): protein: float; carbs: float; fat: float
+class RangeSummaryResponse(BaseModel): data: List[NutritionAnalysisData]
+class CohortUserReport(BaseModel):
+    user_id: int; calorie_goal: float | None; days_logged: int; adherence_rate: float | None
+    avg_calories_7d: float | None; avg_protein_7d: float | None; avg_carbs_7d: float | None; avg_fat_7d: float | None
+    avg_calories_30d: float | None; avg_protein_30d: float | None; avg_carbs_30d: float | None; avg_fat_30d: float | None
+    surplus_streak: int; deficit_streak: int; longest_surplus_streak: int; longest_deficit_streak: int
+class CohortSummary(BaseModel):
+    users: int; active_users: int; avg_adherence_rate: float | None; avg_calories_7d: float | None; avg_calories_30d: float | None
+    users_in_surplus_streak: int; users_in_deficit_streak: int
+class CohortReportResponse(BaseModel): report_date: str; generated_at: str; summary: CohortSummary | None = None; items: List[CohortUserReport]; next_after_user_id: int | None = None
 
 # ======================================================
 #  4. AUTHENTICATION & USER DEPENDENCIES
@@ -125,79 +205,176 @@ class MonthlySummaryResponse(BaseModel): data: List[CalorieAnalysisData]
 def get_user(db: sqlite3.Connection, username: str):
     return db.execute("SELECT * FROM users WHERE username = ?", (username,)).fetchone()
 
-async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], db: Annotated[sqlite3.Connection, Depends(get_db)]):
+def load_user(username: str):
+    with database.reader() as db: return get_user(db, username)
+
+def create_user_token(user) -> str:
+    claims = {"sub": user['username']}
+    if AUTH_PROFILE_IN_TOKEN: claims["profile"] = {k: user[k] for k in TOKEN_PROFILE_FIELDS}
+    return create_access_token(data=claims)
+
+async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
     credentials_exception = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials", headers={"WWW-Authenticate": "Bearer"})
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         if username is None: raise credentials_exception
     except JWTError: raise credentials_exception
-    user = get_user(db, username=username)
-    if user is None: raise credentials_exception
+    profile = payload.get("profile")
+    if AUTH_PROFILE_IN_TOKEN and isinstance(profile, dict) and profile.get('username') == username: return profile
+    user = principal_cache.get(username)
+    if user is None:
+        row = await asyncio.to_thread(load_user, username)
+        if row is None: raise credentials_exception
+        user = principal_cache.put(username, row)
     return user
 
 # ======================================================
 #  5. FASTAPI APP & ENDPOINTS
 # ======================================================
 
-app = FastAPI(title="NutriScan API")
-app.add_middleware(CORSMiddleware, allow_origins=["http://localhost:3000"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if DB_MIGRATE_ON_STARTUP: await asyncio.to_thread(run_migrations)
+    await asyncio.to_thread(refresh_food_index)
+    refresher = asyncio.create_task(keep_food_index_fresh()) if FOOD_INDEX_REFRESH_SECONDS > 0 else None
+    await model_loader.start()
+    await inference_batcher.start()  # no-op when both are the same InferenceClient
+    yield
+    await inference_batcher.stop()
+    await image_service.aclose()
+    if refresher: refresher.cancel()
+    database.close()
+
+app = FastAPI(title="NutriScan API", lifespan=lifespan)
+app.add_middleware(UploadLimitMiddleware, paths=("/api/food/identify",))
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(CORSMiddleware, allow_origins=["http://localhost:3000"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"], expose_headers=["X-Access-Token"])
 
 # --- User Management & Authentication ---
+def registration_conflict(username: str, email: str) -> str | None:
+    with database.reader() as db:
+        if get_user(db, username): return "Username already registered"
+        if db.execute("SELECT id FROM users WHERE email = ?", (email,)).fetchone(): return "Email already registered"
+    return None
+
+def insert_user(username: str, email: str, hashed_password: str):
+    with database.writer() as db:
+        db.execute("INSERT INTO users (username, email, hashed_password) VALUES (?, ?, ?)", (username, email, hashed_password))
+        db.commit()
+        return get_user(db, username)
+
+# Neither handler holds a pooled connection while bcrypt runs: the duplicate checks / user lookup finish
+# and return their connection first, so a signup or login storm can't starve the reader or writer pool.
 @app.post("/api/users/register", response_model=UserInDB, tags=["Authentication"])
-def register_user(user: UserCreate, db: Annotated[sqlite3.Connection, Depends(get_db)]):
-    if get_user(db, user.username): raise HTTPException(status_code=400, detail="Username already registered")
-    if db.execute("SELECT id FROM users WHERE email = ?", (user.email,)).fetchone(): raise HTTPException(status_code=400, detail="Email already registered")
-    hashed_password = get_password_hash(user.password)
-    cursor = db.cursor()
-    cursor.execute("INSERT INTO users (username, email, hashed_password) VALUES (?, ?, ?)", (user.username, user.email, hashed_password))
-    db.commit()
-    new_user = get_user(db, user.username)
+async def register_user(user: UserCreate):
+    conflict = await asyncio.to_thread(registration_conflict, user.username, user.email)
+    if conflict: raise HTTPException(status_code=400, detail=conflict)
+    with stage("bcrypt_hash"):
+        hashed_password = await asyncio.get_running_loop().run_in_executor(password_executor, get_password_hash, user.password)
+    # A concurrent signup can still take the name between the check and the insert; UNIQUE catches that.
+    try: new_user = await asyncio.to_thread(insert_user, user.username, user.email, hashed_password)
+    except sqlite3.IntegrityError: raise HTTPException(status_code=400, detail="Username or email already registered")
     return dict(new_user)
 
 @app.post("/api/users/login", response_model=Token, tags=["Authentication"])
-async def login_for_access_token(form_data: Annotated[OAuth2PasswordRequestForm, Depends()], db: Annotated[sqlite3.Connection, Depends(get_db)]):
-    user = get_user(db, form_data.username)
-    if not user or not verify_password(form_data.password, user['hashed_password']):
+async def login_for_access_token(form_data: Annotated[OAuth2PasswordRequestForm, Depends()]):
+    user = await asyncio.to_thread(load_user, form_data.username)
+    if not user or not await verify_password_async(form_data.password, user['hashed_password']):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect username or password")
-    return {"access_token": create_access_token(data={"sub": user['username']}), "token_type": "bearer"}
+    return {"access_token": create_user_token(user), "token_type": "bearer"}
 
 @app.get("/api/users/me", response_model=UserInDB, tags=["User Profile"])
 async def read_users_me(current_user: Annotated[dict, Depends(get_current_user)]):
     return dict(current_user)
 
 @app.put("/api/users/me", response_model=UserInDB, tags=["User Profile"])
-async def update_user_profile(profile_data: UserUpdate, current_user: Annotated[dict, Depends(get_current_user)], db: Annotated[sqlite3.Connection, Depends(get_db)]):
+async def update_user_profile(profile_data: UserUpdate, response: Response, current_user: Annotated[dict, Depends(get_current_user)], db: Annotated[sqlite3.Connection, Depends(get_db_writer)]):
     update_data = profile_data.model_dump(exclude_unset=True)
     if not update_data: raise HTTPException(status_code=400, detail="No update data provided")
     set_clause = ", ".join([f"{key} = ?" for key in update_data.keys()])
     values = list(update_data.values()) + [current_user['id']]
     db.execute(f"UPDATE users SET {set_clause} WHERE id = ?", tuple(values))
     db.commit()
+    principal_cache.invalidate(current_user['username'])
     updated_user = get_user(db, current_user['username'])
+    if AUTH_PROFILE_IN_TOKEN: response.headers["X-Access-Token"] = create_user_token(updated_user)
     return dict(updated_user)
 
 # --- Public Endpoints (No login required) ---
 @app.get("/api/food/search", response_model=FoodResponse, tags=["Food Data"])
-async def search_food_by_text(q: str, db: Annotated[sqlite3.Connection, Depends(get_db)]):
-    food_data = db.execute("SELECT * FROM foods WHERE name LIKE ? LIMIT 1", (f"%{q}%",)).fetchone()
+async def search_food_by_text(q: str):
+    # Off the event loop: a misspelt query falls through to the trigram pass, which can take tens of ms on a large catalog.
+    with stage("food_lookup"): food_data = await asyncio.to_thread(food_index.best, q)
     if not food_data: raise HTTPException(status_code=404, detail=f"Sorry, '{q}' was not found.")
     image_url = await get_food_image_url(food_data['name'])
     return dict(food_data, image_url=image_url)
 
+@app.get("/api/food/suggest", response_model=List[FoodSuggestion], tags=["Food Data"])
+def suggest_foods(q: str, k: int = Query(10, ge=1, le=50)):
+    return [dict(food, score=score) for score, food in food_index.search(q, k)]
+
+async def classify_upload(file: UploadFile) -> np.ndarray:
+    # Returns the model's per-class output for the upload, from the prediction cache when the same image was seen before.
+    if not model_loader.ready:
+        if model_loader.state == MODEL_FAILED: raise HTTPException(status_code=500, detail="AI Model is not loaded.")
+        raise HTTPException(status_code=503, detail="AI Model is still loading, please retry shortly.", headers={"Retry-After": str(MODEL_RETRY_AFTER_SECONDS)})
+    with stage("upload_read"): image_bytes = await file.read(MAX_UPLOAD_BYTES + 1)
+    with stage("prediction_cache"):
+        key = await asyncio.to_thread(content_key, image_bytes)
+        prediction = prediction_cache.get(key)
+    if prediction is not None: return prediction
+    try:
+        with stage("preprocess"): img_array = await image_preprocessor.run(image_bytes)
+    except ImageRejected as e: raise HTTPException(status_code=e.status_code, detail=e.detail)
+    try:
+        # dHash of the 224x224 input is ~0.1 ms, fine to compute on the event loop.
+        phash = dhash(img_array) if prediction_cache.perceptual else None
+        prediction = prediction_cache.get_similar(phash) if phash is not None else None
+        if prediction is not None: return prediction_cache.put(key, None, prediction)
+        INFERENCE_IN_FLIGHT.inc()
+        try:
+            with stage("inference"): prediction = await inference_batcher.predict(img_array)
+        except InferenceUnavailable as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(MODEL_RETRY_AFTER_SECONDS)})
+        finally: INFERENCE_IN_FLIGHT.dec()
+    finally: image_preprocessor.release(img_array)
+    return prediction_cache.put(key, phash, prediction)
+
 @app.post("/api/food/identify", response_model=FoodResponse, tags=["Food Data"])
-async def identify_food_by_image(db: Annotated[sqlite3.Connection, Depends(get_db)], file: UploadFile = File(...)):
-    if model is None: raise HTTPException(status_code=500, detail="AI Model is not loaded.")
-    image_bytes = await file.read()
-    img = Image.open(BytesIO(image_bytes)).convert('RGB').resize((224, 224))
-    img_array = (np.array(img, dtype=np.float32) / 127.5) - 1
-    predictions = model.predict(np.expand_dims(img_array, axis=0))
-    identified_food_name = class_labels[np.argmax(predictions[0])]
-    food_data = db.execute("SELECT * FROM foods WHERE name LIKE ? LIMIT 1", (f"%{identified_food_name}%",)).fetchone()
+async def identify_food_by_image(file: UploadFile = File(...)):
+    prediction = await classify_upload(file)
+    identified_food_name = model_loader.class_labels[np.argmax(prediction)]
+    with stage("food_lookup"): food_data = await asyncio.to_thread(food_index.best, identified_food_name)
     if not food_data: raise HTTPException(status_code=404, detail=f"AI identified '{identified_food_name}', but it's not in our database.")
-    image_url = await get_food_image_url(food_data['name'])
+    with stage("pexels"): image_url = await get_food_image_url(food_data['name'])
     return dict(food_data, image_url=image_url)
 
+@app.post("/api/food/identify/top", response_model=TopPredictionsResponse, tags=["Food Data"])
+async def identify_food_top_k(file: UploadFile = File(...), k: int = Query(3, ge=1, le=MAX_TOP_K)):
+    prediction = await classify_upload(file)
+    top = np.argsort(prediction)[::-1][:k]
+    labels = [(model_loader.class_labels[i], float(prediction[i])) for i in top]
+    with stage("food_lookup"): foods = await asyncio.to_thread(load_foods_by_name, [label for label, _ in labels])
+    return {"predictions": [{"label": label, "confidence": round(confidence, 4), "food": foods.get(label.lower())} for label, confidence in labels]}
+
+@app.get("/api/health/live", tags=["General"])
+def liveness():
+    return {"status": "ok"}
+
+@app.get("/api/health/ready", tags=["General"])
+def readiness(response: Response, require_model: bool = False):
+    # Non-ML endpoints are ready as soon as startup finishes; pass require_model=true to also wait for the AI model.
+    model_status = model_loader.status()
+    ready = model_loader.ready or not require_model
+    if not ready: response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return {"status": "ready" if ready else "starting", "model": model_status, "food_index_items": len(food_index)}
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def metrics():
+    if not METRICS_ENABLED: raise HTTPException(status_code=404, detail="Metrics are disabled.")
+    return PlainTextResponse(render_latest(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.get("/api/tips/daily", response_model=TipsResponse, tags=["General"])
 def get_daily_tips():
     NUTRITION_TIPS = [
@@ -247,10 +424,9 @@ def get_daily_tips():
 
 # --- Secured Endpoints (Login required) ---
 @app.post("/api/log", response_model=LoggedItem, tags=["Data Logging"])
-def add_food_to_log(food_name: str, current_user: Annotated[dict, Depends(get_current_user)], db: Annotated[sqlite3.Connection, Depends(get_db)]):
-    # --- THIS IS THE CORRECTED LINE ---
-    # Use LIKE for a more flexible search
-    food_data = db.execute("SELECT * FROM foods WHERE name LIKE ? LIMIT 1", (f"%{food_name}%",)).fetchone()
+def add_food_to_log(food_name: str, current_user: Annotated[dict, Depends(get_current_user)], db: Annotated[sqlite3.Connection, Depends(get_db_writer)]):
+    # Ranked lookup (exact > prefix > substring); no fuzzy matches, which could log the wrong food
+    with stage("food_lookup"): food_data = food_index.best(food_name, min_score=LOG_MIN_MATCH_SCORE)
     
     if not food_data:
         raise HTTPException(status_code=404, detail=f"Could not find '{food_name}' to log it.")
@@ -260,6 +436,7 @@ def add_food_to_log(food_name: str, current_user: Annotated[dict, Depends(get_cu
     cursor.execute("INSERT INTO daily_log (user_id, log_date, food_name, calories, protein, carbs, fat) VALUES (?, ?, ?, ?, ?, ?, ?)",
                    (current_user['id'], log_date, food_data['name'], food_data['calories'], food_data['protein'], food_data['carbs'], food_data['fat']))
     new_id = cursor.lastrowid
+    rollup.apply_log_delta(db, current_user['id'], log_date, food_data['calories'], food_data['protein'], food_data['carbs'], food_data['fat'])
     db.commit()
     
     # Return a dictionary that matches the LoggedItem model
@@ -273,6 +450,96 @@ def add_food_to_log(food_name: str, current_user: Annotated[dict, Depends(get_cu
         "fat": food_data['fat']
     }
 
+@app.post("/api/log/bulk", response_model=BulkLogResponse, tags=["Data Logging"])
+def add_foods_to_log(request: BulkLogRequest, current_user: Annotated[dict, Depends(get_current_user)], db: Annotated[sqlite3.Connection, Depends(get_db_writer)]):
+    user_id = current_user['id']
+    today = datetime.now().strftime('%Y-%m-%d')
+    errors, results = [], {}  # results: request index -> LoggedItem dict
+
+    # Retries: keys we've already seen map straight back to the rows they created.
+    keys = {item.client_key for item in request.items if item.client_key}
+    existing = {}
+    if keys:
+        placeholders = ",".join("?" * len(keys))
+        for row in db.execute(f"""SELECT k.client_key, l.id, l.log_date, l.food_name, l.calories, l.protein, l.carbs, l.fat
+                                  FROM log_idempotency k LEFT JOIN daily_log l ON l.id = k.log_id
+                                  WHERE k.user_id = ? AND k.client_key IN ({placeholders})""", (user_id, *keys)):
+            existing[row['client_key']] = dict(row) if row['id'] is not None else None
+
+    foods = {name: food_index.best(name, min_score=LOG_MIN_MATCH_SCORE) for name in {item.food_name for item in request.items}}
+    new_rows, new_indexes, claimed = [], [], {}
+    for index, item in enumerate(request.items):
+        if item.client_key in existing:
+            if existing[item.client_key] is None: errors.append(BulkLogError(index=index, food_name=item.food_name, detail="Already logged, and the entry has since been deleted."))
+            else: results[index] = {k: v for k, v in existing[item.client_key].items() if k != 'client_key'}
+            continue
+        if item.client_key in claimed:
+            claimed[item.client_key].append(index)
+            continue
+        food_data = foods[item.food_name]
+        if not food_data:
+            errors.append(BulkLogError(index=index, food_name=item.food_name, detail=f"Could not find '{item.food_name}' to log it."))
+            continue
+        log_date = item.log_date or today
+        # Store the canonical form: strptime also accepts '2024-1-5', which would never match '2024-01-05' lookups.
+        try: log_date = datetime.strptime(log_date, '%Y-%m-%d').strftime('%Y-%m-%d')
+        except ValueError:
+            errors.append(BulkLogError(index=index, food_name=item.food_name, detail="Invalid date format."))
+            continue
+        q = item.quantity
+        new_rows.append((user_id, log_date, food_data['name'], food_data['calories'] * q, food_data['protein'] * q, food_data['carbs'] * q, food_data['fat'] * q))
+        new_indexes.append(index)
+        if item.client_key: claimed[item.client_key] = [index]
+
+    if new_rows:
+        db.executemany("INSERT INTO daily_log (user_id, log_date, food_name, calories, protein, carbs, fat) VALUES (?, ?, ?, ?, ?, ?, ?)", new_rows)
+        # AUTOINCREMENT ids are handed out consecutively while this transaction holds the write lock.
+        last_id = db.execute("SELECT seq FROM sqlite_sequence WHERE name = 'daily_log'").fetchone()[0]
+        first_id = last_id - len(new_rows) + 1
+        created = {index: {"id": first_id + n, "log_date": row[1], "food_name": row[2], "calories": row[3], "protein": row[4], "carbs": row[5], "fat": row[6]}
+                   for n, (index, row) in enumerate(zip(new_indexes, new_rows))}
+        results.update(created)
+        rollup.apply_log_inserts(db, user_id, [row[1:2] + row[3:] for row in new_rows])
+        db.executemany("INSERT INTO log_idempotency (user_id, client_key, log_id) VALUES (?, ?, ?)",
+                       [(user_id, key, created[indexes[0]]['id']) for key, indexes in claimed.items()])
+        for indexes in claimed.values():
+            for duplicate in indexes[1:]: results[duplicate] = created[indexes[0]]
+        db.commit()
+
+    return BulkLogResponse(items=[results[i] for i in sorted(results)], errors=errors)
+
+def parse_optional_date(value: str | None, field: str) -> str | None:
+    if value is None: return None
+    try: return datetime.strptime(value, '%Y-%m-%d').strftime('%Y-%m-%d')
+    except ValueError: raise HTTPException(status_code=400, detail=f"Invalid {field} format.")
+
+# Registered before /api/log/{log_date_str} so these paths aren't taken for dates.
+@app.get("/api/log/range", response_model=LogPage, tags=["Data Logging"])
+def get_log_range(current_user: Annotated[dict, Depends(get_current_user)], db: Annotated[sqlite3.Connection, Depends(get_db)],
+                  start_date: str | None = None, end_date: str | None = None, cursor: str | None = None,
+                  since_id: int | None = None, deleted_since: int | None = None, limit: int = Query(200, ge=1, le=MAX_LOG_PAGE_SIZE)):
+    start, end = parse_optional_date(start_date, "start_date"), parse_optional_date(end_date, "end_date")
+    try: after = history.decode_cursor(cursor) if cursor else None
+    except ValueError as e: raise HTTPException(status_code=400, detail=str(e))
+    # Read the high-water marks first: anything inserted or deleted while we page is picked up by the next sync.
+    high_water_id = history.high_water_id(db, current_user['id'])
+    deletion_high_water = history.deletion_high_water(db, current_user['id'])
+    items, next_cursor = history.fetch_page(db, current_user['id'], start, end, after, since_id, limit)
+    # Deletions ride on the first page of a sync only; later pages (cursor set) just continue the items.
+    deleted_ids = history.fetch_deletions(db, current_user['id'], start, end, deleted_since, deletion_high_water) if deleted_since is not None and after is None else []
+    return LogPage(items=items, next_cursor=next_cursor, high_water_id=high_water_id, deleted_ids=deleted_ids, deletion_high_water=deletion_high_water)
+
+@app.get("/api/log/export", tags=["Data Logging"])
+def export_log(current_user: Annotated[dict, Depends(get_current_user)], format: ExportFormat = ExportFormat.ndjson,
+               start_date: str | None = None, end_date: str | None = None):
+    start, end = parse_optional_date(start_date, "start_date"), parse_optional_date(end_date, "end_date")
+    try: rows = history.stream_rows(database, current_user['id'], start, end)
+    except ExportsBusy as e: raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(EXPORT_RETRY_AFTER_SECONDS)})
+    if format == ExportFormat.csv: body, media_type = history.csv_chunks(rows), "text/csv"
+    else: body, media_type = history.ndjson_chunks(rows), "application/x-ndjson"
+    filename = f"nutriscan_log_{current_user['username']}.{format.value}"
+    return StreamingResponse(body, media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
 @app.get("/api/log/{log_date_str}", response_model=DailyLogResponse, tags=["Data Logging"])
 def get_log_for_date(log_date_str: str, current_user: Annotated[dict, Depends(get_current_user)], db: Annotated[sqlite3.Connection, Depends(get_db)]):
     rows = db.execute("SELECT * FROM daily_log WHERE log_date = ? AND user_id = ?", (log_date_str, current_user['id'])).fetchall()
@@ -280,12 +547,24 @@ def get_log_for_date(log_date_str: str, current_user: Annotated[dict, Depends(ge
     return DailyLogResponse(items=items, total_calories=sum(item['calories'] for item in items))
 
 @app.delete("/api/log/{log_id}", status_code=status.HTTP_204_NO_CONTENT, tags=["Data Logging"])
-def delete_log_item(log_id: int, current_user: Annotated[dict, Depends(get_current_user)], db: Annotated[sqlite3.Connection, Depends(get_db)]):
-    result = db.execute("DELETE FROM daily_log WHERE id = ? AND user_id = ?", (log_id, current_user['id']))
+def delete_log_item(log_id: int, current_user: Annotated[dict, Depends(get_current_user)], db: Annotated[sqlite3.Connection, Depends(get_db_writer)]):
+    item = db.execute("SELECT log_date, calories, protein, carbs, fat FROM daily_log WHERE id = ? AND user_id = ?", (log_id, current_user['id'])).fetchone()
+    if item is None: raise HTTPException(status_code=404, detail="Log item not found or you do not have permission.")
+    db.execute("DELETE FROM daily_log WHERE id = ?", (log_id,))
+    history.record_deletion(db, current_user['id'], log_id, item['log_date'])
+    rollup.apply_log_delta(db, current_user['id'], item['log_date'], item['calories'], item['protein'], item['carbs'], item['fat'], sign=-1)
     db.commit()
-    if result.rowcount == 0: raise HTTPException(status_code=404, detail="Log item not found or you do not have permission.")
     return
 
+def load_daily_totals(db: sqlite3.Connection, user_id: int, start_date, end_date) -> list[tuple[str, sqlite3.Row | None]]:
+    totals = rollup.load_range(db, user_id, start_date.isoformat(), end_date.isoformat())
+    days = [(start_date + timedelta(days=x)).strftime('%Y-%m-%d') for x in range((end_date - start_date).days + 1)]
+    return [(day, totals.get(day)) for day in days]
+
+def calorie_analysis(db: sqlite3.Connection, user_id: int, start_date, end_date, calorie_goal: float) -> list[CalorieAnalysisData]:
+    return [CalorieAnalysisData(date=dt, total_calories=tc, excess_calories=max(0, tc - calorie_goal), calorie_goal=calorie_goal)
+            for dt, tc in ((day, row['calories'] if row else 0.0) for day, row in load_daily_totals(db, user_id, start_date, end_date))]
+
 @app.post("/api/summary/weekly", response_model=WeeklySummaryResponse, tags=["Data Analysis"])
 def get_weekly_summary(request: WeeklySummaryRequest, current_user: Annotated[dict, Depends(get_current_user)], db: Annotated[sqlite3.Connection, Depends(get_db)]):
     calorie_goal = calculate_daily_calorie_goal(dict(current_user))
@@ -293,13 +572,7 @@ def get_weekly_summary(request: WeeklySummaryRequest, current_user: Annotated[di
     try: end_date = datetime.strptime(request.date_str, '%Y-%m-%d').date()
     except (ValueError, TypeError): raise HTTPException(status_code=400, detail="Invalid date format.")
     start_date = end_date - timedelta(days=6)
-    date_range = [start_date + timedelta(days=x) for x in range(7)]
-    results_dict = {day.strftime('%Y-%m-%d'): 0.0 for day in date_range}
-    rows = db.execute("SELECT log_date, SUM(calories) as total FROM daily_log WHERE user_id = ? AND log_date BETWEEN ? AND ? GROUP BY log_date",
-                      (current_user['id'], start_date, end_date)).fetchall()
-    for row in rows: results_dict[row['log_date']] = row['total']
-    final_data = [CalorieAnalysisData(date=dt, total_calories=tc, excess_calories=max(0, tc - calorie_goal), calorie_goal=calorie_goal) for dt, tc in results_dict.items()]
-    return WeeklySummaryResponse(data=final_data)
+    return WeeklySummaryResponse(data=calorie_analysis(db, current_user['id'], start_date, end_date, calorie_goal))
 
 @app.post("/api/summary/monthly", response_model=MonthlySummaryResponse, tags=["Data Analysis"])
 def get_monthly_summary(request: MonthlySummaryRequest, current_user: Annotated[dict, Depends(get_current_user)], db: Annotated[sqlite3.Connection, Depends(get_db)]):
@@ -310,11 +583,32 @@ def get_monthly_summary(request: MonthlySummaryRequest, current_user: Annotated[
         start_date = datetime(request.year, request.month, 1).date()
         end_date = datetime(request.year, request.month, num_days).date()
     except (ValueError, TypeError): raise HTTPException(status_code=400, detail="Invalid year or month.")
-    
-    date_range = [start_date + timedelta(days=x) for x in range(num_days)]
-    results_dict = {day.strftime('%Y-%m-%d'): 0.0 for day in date_range}
-    rows = db.execute("SELECT log_date, SUM(calories) as total FROM daily_log WHERE user_id = ? AND log_date BETWEEN ? AND ? GROUP BY log_date",
-                      (current_user['id'], start_date, end_date)).fetchall()
-    for row in rows: results_dict[row['log_date']] = row['total']
-    final_data = [CalorieAnalysisData(date=dt, total_calories=tc, excess_calories=max(0, tc - calorie_goal), calorie_goal=calorie_goal) for dt, tc in results_dict.items()]
-    return MonthlySummaryResponse(data=final_data)
\ No newline at end of file
+    return MonthlySummaryResponse(data=calorie_analysis(db, current_user['id'], start_date, end_date, calorie_goal))
+
+@app.post("/api/summary/range", response_model=RangeSummaryResponse, tags=["Data Analysis"])
+def get_range_summary(request: RangeSummaryRequest, current_user: Annotated[dict, Depends(get_current_user)], db: Annotated[sqlite3.Connection, Depends(get_db)]):
+    try:
+        start_date = datetime.strptime(request.start_date, '%Y-%m-%d').date()
+        end_date = datetime.strptime(request.end_date, '%Y-%m-%d').date()
+    except (ValueError, TypeError): raise HTTPException(status_code=400, detail="Invalid date format.")
+    if end_date < start_date: raise HTTPException(status_code=400, detail="end_date must not be before start_date.")
+    if (end_date - start_date).days >= MAX_SUMMARY_RANGE_DAYS: raise HTTPException(status_code=400, detail=f"Date range is limited to {MAX_SUMMARY_RANGE_DAYS} days.")
+    calorie_goal = calculate_daily_calorie_goal(dict(current_user))
+    final_data = []
+    for dt, row in load_daily_totals(db, current_user['id'], start_date, end_date):
+        tc, protein, carbs, fat = (row['calories'], row['protein'], row['carbs'], row['fat']) if row else (0.0, 0.0, 0.0, 0.0)
+        excess = max(0, tc - calorie_goal) if calorie_goal else 0
+        final_data.append(NutritionAnalysisData(date=dt, total_calories=tc, excess_calories=excess, calorie_goal=calorie_goal, protein=protein, carbs=carbs, fat=fat))
+    return RangeSummaryResponse(data=final_data)
+
+@app.get("/api/reports/cohort", response_model=CohortReportResponse, tags=["Data Analysis"])
+def get_cohort_report(current_user: Annotated[dict, Depends(get_current_user)], db: Annotated[sqlite3.Connection, Depends(get_db)],
+                      report_date: str | None = None, after_user_id: int = 0, limit: int = Query(500, ge=1, le=MAX_LOG_PAGE_SIZE)):
+    # Reads the report written by the nightly `python cohort.py` job; defaults to the latest finished run.
+    if current_user['username'] not in COHORT_REPORT_USERS: raise HTTPException(status_code=403, detail="Not allowed to view cohort reports.")
+    run = cohort.find_run(db, parse_optional_date(report_date, "report_date"))
+    if run is None: raise HTTPException(status_code=404, detail="No finished cohort report for that date.")
+    items = cohort.load_report(db, run['report_date'], after_user_id, limit)
+    summary = cohort.summarize(db, run['report_date']) if after_user_id == 0 else None
+    next_after = items[-1]['user_id'] if len(items) == limit else None
+    return {"report_date": run['report_date'], "generated_at": run['finished_at'], "summary": summary, "items": items, "next_after_user_id": next_after}
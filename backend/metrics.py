@@ -0,0 +1,176 @@
+import os
+import json
+import time
+import random
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# ======================================================
+#  METRICS (Prometheus text format, no dependencies)
+# ======================================================
+# Counters, gauges and histograms kept in plain dicts behind a lock, rendered
+# on demand by GET /metrics. Recording a sample is a dict lookup, a bisect and
+# an add, so it's cheap enough to leave on in production.
+#
+# stage("name") times one step of a request (decode, inference, a DB query,
+# bcrypt, ...) into nutriscan_stage_duration_seconds, and also remembers it
+# for the current request so slow requests can be logged with a breakdown.
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "1.0"))  # 0 disables slow-request logging
+SLOW_REQUEST_SAMPLE_RATE = float(os.getenv("SLOW_REQUEST_SAMPLE_RATE", "1.0"))
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+_request_stages: ContextVar[list | None] = ContextVar("request_stages", default=None)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra: parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(n, "") for n in self.labelnames)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock: items = list(self._values.items())
+        for key, value in items: lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock: self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock: self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1.0, **labels): self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock: self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None: entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock: items = [(key, (list(counts), total, n)) for key, (counts, total, n) in self._values.items()]
+        for key, (counts, total, n) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="' + ("+Inf" if bound == float("inf") else repr(bound)) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {n}")
+        return lines
+
+
+def render_latest() -> str:
+    return "\n".join(line for metric in _registry for line in metric.render()) + "\n"
+
+
+# --- Application metrics ---
+HTTP_REQUEST_SECONDS = Histogram("nutriscan_http_request_duration_seconds", "HTTP request latency by route.", ("method", "route", "status"))
+HTTP_IN_FLIGHT = Gauge("nutriscan_http_requests_in_flight", "HTTP requests currently being served.")
+STAGE_SECONDS = Histogram("nutriscan_stage_duration_seconds", "Time spent in one step of request handling.", ("stage",))
+CACHE_EVENTS = Counter("nutriscan_cache_events_total", "Cache lookups by cache and outcome.", ("cache", "result"))
+INFERENCE_IN_FLIGHT = Gauge("nutriscan_inference_in_flight", "Images queued or running in the inference scheduler.")
+INFERENCE_BATCH_SIZE = Histogram("nutriscan_inference_batch_size", "Images per model call.", (), (1, 2, 4, 8, 16, 32, 64))
+SLOW_REQUESTS = Counter("nutriscan_slow_requests_total", "Requests slower than SLOW_REQUEST_SECONDS.", ("route",))
+
+
+@contextmanager
+def stage(name: str):
+    if not METRICS_ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    try: yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        stages = _request_stages.get()
+        if stages is not None: stages.append((name, elapsed))
+
+
+def cache_event(cache: str, result: str):
+    if METRICS_ENABLED: CACHE_EVENTS.inc(cache=cache, result=result)
+
+
+class MetricsMiddleware:
+    # Plain ASGI middleware (no BaseHTTPMiddleware) to keep per-request overhead to a few microseconds.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            return await self.app(scope, receive, send)
+        status_code = 500
+        stages = []
+        token = _request_stages.set(stages)
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start": status_code = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try: await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            HTTP_IN_FLIGHT.dec()
+            _request_stages.reset(token)
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_REQUEST_SECONDS.observe(elapsed, method=scope["method"], route=route, status=str(status_code))
+            if SLOW_REQUEST_SECONDS and elapsed >= SLOW_REQUEST_SECONDS:
+                SLOW_REQUESTS.inc(route=route)
+                if random.random() < SLOW_REQUEST_SAMPLE_RATE:
+                    print("SLOW REQUEST " + json.dumps({"method": scope["method"], "route": route, "status": status_code, "seconds": round(elapsed, 4),
+                                                        "stages": [[name, round(s, 4)] for name, s in stages]}))
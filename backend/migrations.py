@@ -0,0 +1,192 @@
+import sys
+import sqlite3
+import argparse
+
+# ======================================================
+#  VERSIONED SCHEMA MIGRATIONS
+# ======================================================
+# Each migration runs once, in order, inside its own transaction, and bumps
+# `PRAGMA user_version` to its number. Existing databases are upgraded in
+# place, so schema changes never require deleting my_nutrition.db.
+# Append new migrations to the end of MIGRATIONS; never edit a shipped one.
+
+DB_NAME = 'my_nutrition.db'
+
+MIGRATIONS = [
+    (1, "baseline schema", [
+        """CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL UNIQUE,
+            email TEXT NOT NULL UNIQUE,
+            hashed_password TEXT NOT NULL,
+            age INTEGER,
+            weight REAL,
+            height REAL,
+            sex TEXT,
+            activity_level TEXT,
+            password_reset_token TEXT,
+            password_reset_expires TIMESTAMP
+        )""",
+        """CREATE TABLE IF NOT EXISTS daily_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            log_date TEXT NOT NULL,
+            food_name TEXT NOT NULL,
+            calories REAL NOT NULL,
+            protein REAL NOT NULL,
+            carbs REAL NOT NULL,
+            fat REAL NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        )""",
+        """CREATE TABLE IF NOT EXISTS foods (
+            name TEXT, calories REAL, protein REAL, carbs REAL, fat REAL, sodium REAL, cholesterol REAL
+        )""",
+    ]),
+    (2, "pexels image cache table", [
+        "CREATE TABLE IF NOT EXISTS food_images (food_name TEXT PRIMARY KEY, image_url TEXT, expires_at REAL NOT NULL)",
+    ]),
+    (3, "hot-path indexes for daily_log and foods", [
+        # Covers the per-day lookups and lets the summary SUM(calories) run from the index alone.
+        "CREATE INDEX IF NOT EXISTS idx_daily_log_user_date ON daily_log (user_id, log_date, calories)",
+        "CREATE INDEX IF NOT EXISTS idx_foods_name ON foods (name COLLATE NOCASE)",
+        "ANALYZE",
+    ]),
+    (4, "daily_totals rollup", [
+        """CREATE TABLE IF NOT EXISTS daily_totals (
+            user_id INTEGER NOT NULL,
+            log_date TEXT NOT NULL,
+            calories REAL NOT NULL DEFAULT 0,
+            protein REAL NOT NULL DEFAULT 0,
+            carbs REAL NOT NULL DEFAULT 0,
+            fat REAL NOT NULL DEFAULT 0,
+            items INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, log_date)
+        ) WITHOUT ROWID""",
+        """INSERT OR REPLACE INTO daily_totals (user_id, log_date, calories, protein, carbs, fat, items)
+           SELECT user_id, log_date, TOTAL(calories), TOTAL(protein), TOTAL(carbs), TOTAL(fat), COUNT(*)
+           FROM daily_log GROUP BY user_id, log_date""",
+    ]),
+    (5, "idempotency keys for bulk logging", [
+        """CREATE TABLE IF NOT EXISTS log_idempotency (
+            user_id INTEGER NOT NULL,
+            client_key TEXT NOT NULL,
+            log_id INTEGER NOT NULL,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, client_key)
+        ) WITHOUT ROWID""",
+    ]),
+    (6, "order daily_log index by (log_date, id) for keyset paging", [
+        # Summaries read daily_totals now, so calories no longer needs to be covered; with (user_id, log_date)
+        # the implicit trailing rowid gives (log_date, id) order without a sort.
+        "DROP INDEX IF EXISTS idx_daily_log_user_date",
+        "CREATE INDEX IF NOT EXISTS idx_daily_log_user_date_id ON daily_log (user_id, log_date)",
+    ]),
+    (7, "stable food ids with unique names for incremental catalog ingestion", [
+        # Rebuilt rather than altered: SQLite can't add a PRIMARY KEY or UNIQUE constraint in place.
+        """CREATE TABLE foods_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            calories REAL NOT NULL DEFAULT 0,
+            protein REAL NOT NULL DEFAULT 0,
+            carbs REAL NOT NULL DEFAULT 0,
+            fat REAL NOT NULL DEFAULT 0,
+            sodium REAL NOT NULL DEFAULT 0,
+            cholesterol REAL NOT NULL DEFAULT 0
+        )""",
+        """INSERT INTO foods_new (name, calories, protein, carbs, fat, sodium, cholesterol)
+           SELECT name, TOTAL(calories) / COUNT(*), TOTAL(protein) / COUNT(*), TOTAL(carbs) / COUNT(*),
+                  TOTAL(fat) / COUNT(*), TOTAL(sodium) / COUNT(*), TOTAL(cholesterol) / COUNT(*)
+           FROM foods WHERE name IS NOT NULL GROUP BY name ORDER BY MIN(rowid)""",
+        "DROP TABLE foods",
+        "ALTER TABLE foods_new RENAME TO foods",
+        "CREATE INDEX IF NOT EXISTS idx_foods_name ON foods (name COLLATE NOCASE)",
+    ]),
+    (8, "cohort analytics report tables", [
+        """CREATE TABLE IF NOT EXISTS cohort_report (
+            report_date TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            calorie_goal REAL,
+            days_logged INTEGER NOT NULL,
+            adherence_rate REAL,
+            avg_calories_7d REAL, avg_protein_7d REAL, avg_carbs_7d REAL, avg_fat_7d REAL,
+            avg_calories_30d REAL, avg_protein_30d REAL, avg_carbs_30d REAL, avg_fat_30d REAL,
+            surplus_streak INTEGER NOT NULL,
+            deficit_streak INTEGER NOT NULL,
+            longest_surplus_streak INTEGER NOT NULL,
+            longest_deficit_streak INTEGER NOT NULL,
+            PRIMARY KEY (report_date, user_id)
+        ) WITHOUT ROWID""",
+        # A report date is only served once its run has finished writing every user.
+        """CREATE TABLE IF NOT EXISTS cohort_report_runs (
+            report_date TEXT PRIMARY KEY,
+            users INTEGER NOT NULL,
+            seconds REAL NOT NULL,
+            finished_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )""",
+    ]),
+    (9, "daily_log deletion tombstones for incremental sync", [
+        # seq orders deletions the way daily_log.id orders inserts; AUTOINCREMENT so it never goes backwards.
+        """CREATE TABLE IF NOT EXISTS daily_log_deletions (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            log_id INTEGER NOT NULL,
+            log_date TEXT NOT NULL,
+            deleted_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_daily_log_deletions_user_seq ON daily_log_deletions (user_id, seq)",
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection, target: int = LATEST_VERSION, verbose: bool = True) -> int:
+    previous_isolation = conn.isolation_level
+    conn.isolation_level = None  # we manage BEGIN/COMMIT ourselves so DDL and the version bump commit together
+    try:
+        for version, name, steps in MIGRATIONS:
+            if version > target: break
+            if version <= current_version(conn): continue
+            # IMMEDIATE takes the write lock up front; re-check so concurrent workers don't apply a step twice.
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if version <= current_version(conn):
+                    conn.execute("ROLLBACK")
+                    continue
+                for step in steps:
+                    if callable(step): step(conn)
+                    else: conn.execute(step)
+                conn.execute(f"PRAGMA user_version = {version}")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            if verbose: print(f"Applied migration {version}: {name}")
+    finally:
+        conn.isolation_level = previous_isolation
+    return current_version(conn)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Upgrade the NutriScan database schema in place.")
+    parser.add_argument("--db", default=DB_NAME)
+    parser.add_argument("--to", type=int, default=LATEST_VERSION, help="target schema version")
+    parser.add_argument("--status", action="store_true", help="print the current version and exit")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    try:
+        version = current_version(conn)
+        if args.status:
+            print(f"Schema version {version} (latest {LATEST_VERSION}).")
+            for v, name, _ in MIGRATIONS:
+                if v > version: print(f"  pending {v}: {name}")
+            sys.exit(0)
+        version = migrate(conn, args.to)
+        print(f"Database '{args.db}' is at schema version {version}.")
+    finally:
+        conn.close()
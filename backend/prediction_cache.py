@@ -0,0 +1,90 @@
+import os
+import hashlib
+import threading
+import numpy as np
+from collections import OrderedDict
+from metrics import cache_event
+
+# ======================================================
+#  IMAGE PREDICTION CACHE
+# ======================================================
+# Re-uploads of the same photo skip decoding and inference entirely: the
+# model's output vector is kept in an LRU keyed by a hash of the raw upload
+# bytes. Optionally (PREDICTION_CACHE_PERCEPTUAL=1) a 64-bit difference hash
+# of the normalised model input is kept as a second key, so re-encoded or
+# near-identical shots hit too; those still pay for the decode but not for
+# the model. Entries are one float32 vector per class, so memory is bounded
+# by PREDICTION_CACHE_SIZE * len(labels) * 4 bytes per key kind.
+
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "4096"))  # entries per key kind; 0 disables
+PREDICTION_CACHE_PERCEPTUAL = os.getenv("PREDICTION_CACHE_PERCEPTUAL", "0") == "1"
+PREDICTION_CACHE_MAX_DISTANCE = int(os.getenv("PREDICTION_CACHE_MAX_DISTANCE", "0"))  # differing dHash bits still treated as the same image
+
+
+def content_key(data: bytes) -> bytes:
+    # blake2b releases the GIL on large inputs, so this can run off the event loop.
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def dhash(pixels: np.ndarray, size: int = 8) -> int:
+    # Difference hash: average the (H, W, 3) input down to a size x (size + 1) grayscale grid and keep one
+    # bit per horizontally adjacent pair (is the right cell brighter?).
+    gray = pixels.mean(axis=2)
+    rows = np.linspace(0, gray.shape[0], size + 1).astype(int)
+    cols = np.linspace(0, gray.shape[1], size + 2).astype(int)
+    sums = np.add.reduceat(np.add.reduceat(gray, rows[:-1], axis=0), cols[:-1], axis=1)
+    grid = sums / np.outer(np.diff(rows), np.diff(cols))
+    return int.from_bytes(np.packbits(grid[:, 1:] > grid[:, :-1]).tobytes(), 'big')
+
+
+class PredictionCache:
+    def __init__(self, max_size: int = PREDICTION_CACHE_SIZE, perceptual: bool = PREDICTION_CACHE_PERCEPTUAL,
+                 max_distance: int = PREDICTION_CACHE_MAX_DISTANCE):
+        self.max_size = max_size
+        self.perceptual = perceptual and max_size > 0
+        self.max_distance = max_distance
+        self._exact: OrderedDict[bytes, np.ndarray] = OrderedDict()
+        self._similar: OrderedDict[int, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self): return len(self._exact)
+
+    def get(self, key: bytes) -> np.ndarray | None:
+        if self.max_size <= 0: return None
+        with self._lock:
+            prediction = self._exact.get(key)
+            if prediction is not None: self._exact.move_to_end(key)
+        cache_event("prediction", "hit" if prediction is not None else "miss")
+        return prediction
+
+    def get_similar(self, phash: int) -> np.ndarray | None:
+        if not self.perceptual: return None
+        with self._lock:
+            match = phash if phash in self._similar else None
+            if match is None and self.max_distance > 0:
+                # Linear scan, but over at most max_size ints; only runs after an exact miss.
+                match = next((h for h in reversed(self._similar) if (h ^ phash).bit_count() <= self.max_distance), None)
+            prediction = self._similar.get(match) if match is not None else None
+            if prediction is not None: self._similar.move_to_end(match)
+        cache_event("prediction_perceptual", "hit" if prediction is not None else "miss")
+        return prediction
+
+    def put(self, key: bytes, phash: int | None, prediction: np.ndarray) -> np.ndarray:
+        if self.max_size <= 0: return prediction
+        # Own copy, read-only: the batcher's output rows are views into a shared batch array.
+        prediction = np.array(prediction, dtype=np.float32)
+        prediction.setflags(write=False)
+        with self._lock:
+            self._store(self._exact, key, prediction)
+            if phash is not None and self.perceptual: self._store(self._similar, phash, prediction)
+        return prediction
+
+    def _store(self, entries: OrderedDict, key, prediction: np.ndarray):
+        entries[key] = prediction
+        entries.move_to_end(key)
+        while len(entries) > self.max_size: entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._exact.clear()
+            self._similar.clear()
@@ -0,0 +1,98 @@
+import os
+import asyncio
+import queue
+import numpy as np
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, UnidentifiedImageError
+from starlette.responses import JSONResponse
+
+# ======================================================
+#  UPLOAD DECODE & PREPROCESSING
+# ======================================================
+# Phone photos are 12MP+, but the model only sees 224x224. For JPEGs we ask
+# libjpeg for a reduced-size decode (draft mode, a 1/2-1/8 DCT scale that
+# still covers the target size), so full-resolution pixels are never
+# materialised. Normalised pixels are written straight into reusable float32
+# buffers, and decoding runs on a thread pool (PIL releases the GIL) so the
+# event loop stays free.
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(15 * 1024 * 1024)))
+UPLOAD_FORM_OVERHEAD_BYTES = 64 * 1024  # multipart boundaries and part headers around the file itself
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", str(50_000_000)))
+PREPROCESS_WORKERS = int(os.getenv("PREPROCESS_WORKERS", str(min(4, os.cpu_count() or 1))))
+PREPROCESS_BUFFERS = int(os.getenv("PREPROCESS_BUFFERS", "64"))
+
+# Let PIL's own decompression-bomb guard agree with ours.
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+
+def _too_large_detail() -> str: return f"Upload is too large; the limit is {MAX_UPLOAD_BYTES // (1024 * 1024)} MB."
+
+
+class UploadLimitMiddleware:
+    # Starlette receives and spools the whole multipart body before the endpoint runs, so the size check in
+    # preprocess() only fires after the bandwidth and disk are spent. This answers 413 from Content-Length
+    # before any of the body is read; chunked uploads (no Content-Length) still rely on that later check.
+    def __init__(self, app, paths: tuple[str, ...], max_bytes: int = MAX_UPLOAD_BYTES + UPLOAD_FORM_OVERHEAD_BYTES):
+        self.app = app
+        self.paths = paths
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith(self.paths):
+            length = dict(scope["headers"]).get(b"content-length", b"")
+            if length.isdigit() and int(length) > self.max_bytes:
+                return await JSONResponse({"detail": _too_large_detail()}, status_code=413, headers={"Connection": "close"})(scope, receive, send)
+        return await self.app(scope, receive, send)
+
+
+class ImageRejected(ValueError):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def decode_image(data: bytes, size: tuple[int, int]) -> Image.Image:
+    try:
+        img = Image.open(BytesIO(data))
+        if img.width * img.height > MAX_IMAGE_PIXELS:
+            raise ImageRejected(413, f"Image is too large ({img.width}x{img.height}); the limit is {MAX_IMAGE_PIXELS} pixels.")
+        img.draft('RGB', size)  # no-op for non-JPEG formats
+        img = img.convert('RGB')
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError) as e:
+        raise ImageRejected(400, f"Could not read the uploaded image: {e}")
+    return img.resize(size, reducing_gap=3.0)
+
+
+class ImagePreprocessor:
+    def __init__(self, size: tuple[int, int] = (224, 224), workers: int = PREPROCESS_WORKERS, buffers: int = PREPROCESS_BUFFERS):
+        self.size = size
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="preprocess")
+        self._buffers: queue.SimpleQueue[np.ndarray] = queue.SimpleQueue()
+        self._max_buffers = buffers
+        self._allocated = 0
+
+    def _acquire_buffer(self) -> np.ndarray:
+        try: return self._buffers.get_nowait()
+        except queue.Empty: pass
+        self._allocated += 1
+        return np.empty((self.size[1], self.size[0], 3), dtype=np.float32)
+
+    def release(self, buffer: np.ndarray):
+        # Buffers beyond the pool size are simply dropped and garbage collected.
+        if self._buffers.qsize() < self._max_buffers: self._buffers.put(buffer)
+
+    def preprocess(self, data: bytes) -> np.ndarray:
+        # Returns a (H, W, 3) float32 array in [-1, 1]; hand it back with release() when done.
+        if len(data) > MAX_UPLOAD_BYTES:
+            raise ImageRejected(413, _too_large_detail())
+        pixels = np.asarray(decode_image(data, self.size))
+        buffer = self._acquire_buffer()
+        np.divide(pixels, 127.5, out=buffer, casting='unsafe')
+        np.subtract(buffer, 1, out=buffer)
+        return buffer
+
+    async def run(self, data: bytes) -> np.ndarray:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self.preprocess, data)
@@ -0,0 +1,91 @@
+import sys
+import sqlite3
+import argparse
+
+# ======================================================
+#  DAILY NUTRITION ROLLUP (daily_totals)
+# ======================================================
+# One row per (user, day) holding the summed macros of that day's daily_log
+# entries. Writers call apply_log_delta() inside the same transaction as the
+# daily_log INSERT/DELETE, so summaries can read at most one row per day.
+# The table is created and first backfilled by migration 4.
+
+MACROS = ('calories', 'protein', 'carbs', 'fat')
+TOLERANCE = 1e-6
+
+
+_UPSERT_SQL = """
+    INSERT INTO daily_totals (user_id, log_date, calories, protein, carbs, fat, items) VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (user_id, log_date) DO UPDATE SET
+        calories = calories + excluded.calories, protein = protein + excluded.protein,
+        carbs = carbs + excluded.carbs, fat = fat + excluded.fat, items = items + excluded.items
+"""
+
+
+def apply_log_delta(db: sqlite3.Connection, user_id: int, log_date: str, calories: float, protein: float, carbs: float, fat: float, sign: int = 1):
+    db.execute(_UPSERT_SQL, (user_id, log_date, sign * calories, sign * protein, sign * carbs, sign * fat, sign))
+    if sign < 0:
+        db.execute("DELETE FROM daily_totals WHERE user_id = ? AND log_date = ? AND items <= 0", (user_id, log_date))
+
+
+def apply_log_inserts(db: sqlite3.Connection, user_id: int, rows: list[tuple[str, float, float, float, float]]):
+    # Batch form for many new (log_date, calories, protein, carbs, fat) entries: one upsert per distinct day.
+    per_day: dict[str, list] = {}
+    for log_date, *macros in rows:
+        totals = per_day.setdefault(log_date, [0.0, 0.0, 0.0, 0.0, 0])
+        for i, value in enumerate(macros): totals[i] += value
+        totals[4] += 1
+    db.executemany(_UPSERT_SQL, [(user_id, log_date, *totals) for log_date, totals in per_day.items()])
+
+
+def backfill(db: sqlite3.Connection, user_id: int | None = None):
+    where, params = ("WHERE user_id = ?", (user_id,)) if user_id is not None else ("", ())
+    db.execute(f"DELETE FROM daily_totals {where}", params)
+    db.execute(f"""
+        INSERT INTO daily_totals (user_id, log_date, calories, protein, carbs, fat, items)
+        SELECT user_id, log_date, TOTAL(calories), TOTAL(protein), TOTAL(carbs), TOTAL(fat), COUNT(*)
+        FROM daily_log {where} GROUP BY user_id, log_date
+    """, params)
+
+
+def verify(db: sqlite3.Connection, user_id: int | None = None) -> list[dict]:
+    # Returns every (user, day) whose rollup disagrees with the raw log, including rows missing on either side.
+    where, params = ("WHERE user_id = ?", (user_id,)) if user_id is not None else ("", ())
+    raw = f"SELECT user_id, log_date, TOTAL(calories) AS calories, TOTAL(protein) AS protein, TOTAL(carbs) AS carbs, TOTAL(fat) AS fat, COUNT(*) AS items FROM daily_log {where} GROUP BY user_id, log_date"
+    rollup = f"SELECT user_id, log_date, calories, protein, carbs, fat, items FROM daily_totals {where}"
+    mismatch = " OR ".join(f"ABS(IFNULL(r.{m}, 0) - IFNULL(t.{m}, 0)) > {TOLERANCE}" for m in MACROS + ('items',))
+    rows = db.execute(f"""
+        SELECT r.user_id, r.log_date, r.calories AS expected_calories, t.calories AS rollup_calories, r.items AS expected_items, t.items AS rollup_items
+        FROM ({raw}) r LEFT JOIN ({rollup}) t USING (user_id, log_date) WHERE {mismatch}
+        UNION ALL
+        SELECT t.user_id, t.log_date, NULL, t.calories, NULL, t.items
+        FROM ({rollup}) t LEFT JOIN ({raw}) r USING (user_id, log_date) WHERE r.user_id IS NULL
+    """, params + params + params + params).fetchall()
+    return [dict(zip(('user_id', 'log_date', 'expected_calories', 'rollup_calories', 'expected_items', 'rollup_items'), row)) for row in rows]
+
+
+def load_range(db: sqlite3.Connection, user_id: int, start_date: str, end_date: str) -> dict[str, sqlite3.Row]:
+    rows = db.execute("SELECT log_date, calories, protein, carbs, fat FROM daily_totals WHERE user_id = ? AND log_date BETWEEN ? AND ?",
+                      (user_id, start_date, end_date)).fetchall()
+    return {row[0]: row for row in rows}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild or check the daily_totals rollup against daily_log.")
+    parser.add_argument("command", choices=["backfill", "verify"])
+    parser.add_argument("--db", default='my_nutrition.db')
+    parser.add_argument("--user-id", type=int, default=None)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    try:
+        if args.command == "backfill":
+            with conn: backfill(conn, args.user_id)
+            print(f"Rollup rebuilt: {conn.execute('SELECT COUNT(*) FROM daily_totals').fetchone()[0]} day rows.")
+        else:
+            problems = verify(conn, args.user_id)
+            for p in problems[:50]: print(f"MISMATCH {p}")
+            print(f"{len(problems)} mismatched day rows.")
+            sys.exit(1 if problems else 0)
+    finally:
+        conn.close()